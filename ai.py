@@ -1,172 +1,793 @@
 import bisect
+import os
+import pickle
+import random
+import time
 
-from chess import *
+import numpy as np
 
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-class FrozenTile:
-    seen = []
+from pieces import *
+from game import *
+from bitboard import attacks
 
-    def __init__(self, x, y, board):
-        self.x = x
-        self.y = y
-        self.board = board
+import instrument
 
-        self.type = None
-        self.piece = None
 
-    def load(self, piece, typ):
-        self.piece = piece
-        self.type = typ
+WIN = 1000000
+MATERIAL = 10
 
-    def see(self, by: Piece):
-        self.seen += [(self.piece, self.type)]
+# scores closer to WIN than this are wins found at some ply, and stored relative to the node
+MATE = WIN - 1000
 
-    def make_move(self, dx, dy):
-        return self.piece, (self.x + dx, self.y + dy)
 
-    def move(self, piece: Piece):
-        self.piece = piece
-        self.type = 
+def covering_score(board):
+    """
+    Rate every piece by how well it is covered: the number of its own pieces seeing it,
+    minus the number of enemy pieces seeing it.
 
-    def set(self, piece):
-        self.piece = piece
-        self.place_on_screen(piece)
+    :return: the score of either colour
+    """
+    scores = {c: 0 for c in COLOURS}
 
-    def offset(self, dx, dy):
-        return self.board.get_tile(self.x + dx, self.y + dy)
+    for colour in COLOURS:
+        own, enemy = board.counts[colour], board.counts[other(colour)]
 
-    def set_state(self, colour, state):
-        if state == "hidden":
-            self.board.itemconfigure(self.canvas_id, fill=TILE_UNSEEN_WHITE if self.colour == "white" else TILE_UNSEEN_BLACK)
+        for piece in board.pieces[colour]:
+            sq = board.where[piece].index
 
-        p = self.piece
-        if p:
-            if p.colour == colour:
-                p.set_state(state)
+            # a piece always sees its own tile
+            scores[colour] += rate_cover(piece, own[sq] - 1 - enemy[sq])
 
-                if state == "normal":
-                    self.board.tag_raise(p.tag)
+    return scores
 
-        m = self.memory[colour]
-        if m and self.do_memory:
-            m.set_state(state)
 
-            if state == "normal":
-                self.board.tag_raise(m.tag)
+def rate_cover(piece, coverage):
+    if isinstance(piece, King):
+        return -1000 if coverage < 0 else 0
+    else:
+        return piece.VALUE * coverage
 
-    def place_on_screen(self, piece):
-        if piece:
-            self.board.coords(piece.tag, self.board.screen_coord(self.x, self.y, True))
 
-    def valid(self, dx, dy):
-        return self.piece and self.piece.is_valid_move(self, dx, dy)
+def evaluate(board, colour):
+    """
+    :return: how good the position is for colour
+    """
+    if board.winner:
+        return 0 if board.winner == "tie" else WIN if board.winner == colour else -WIN
 
-def covering_score(pieces, board, seen, colour):
-    # don't cheat!
-    covering = {}
+    score = covering_score(board)
+    material = {c: sum(p.VALUE for p in board.pieces[c]) for c in COLOURS}
 
-    for piece in itr.chain(pieces, seen):
-        covering[piece] = 0
+    return score[colour] - score[other(colour)] + MATERIAL * (material[colour] - material[other(colour)])
 
-    for t in board.flat:
-        if t.memory[colour] and not t.piece in seen:
-            covering[t.memory[colour]] = 0
 
-    for piece in covering:
-        seen = piece.vision()
+def _row(bb):
+    """
+    :return: the bitboard bb as an array of 64 zeroes and ones
+    """
+    return np.unpackbits(np.frombuffer(bb.to_bytes(8, "little"), np.uint8), bitorder="little").astype(np.int16)
 
-        covering[seen] += 1 if piece.colour == seen.colour else -1
 
-    scores = {"black": 0, "white": 0}
+def batch_evaluate(board, candidates):
+    """
+    Evaluate the positions after each of the candidate moves of the side to move at once, without making them.
+    Only the vision of the pieces a move touches is recomputed, from the attack tables,
+    the coverage and material of all positions are then rated together.
 
-    for piece, coverage in covering.items():
-        scores[piece.colour] += rate_cover(piece, coverage)
+    :param candidates: valid moves (x1, y1, x2, y2) of the side to move
+    :return: an array of the scores evaluate would give each position, for the side to move
+    """
+    colour = board.turn
+    enemy = other(colour)
+    n = len(candidates)
 
-    return scores
+    flat = board.board.flat
+    occupied = board.occupied
+    sight = board.sight
+    sliders = [(p, s) for p, s in sight.items() if p.SLIDES]
 
+    counts = {c: np.tile(np.array(board.counts[c], np.int16), (n, 1)) for c in COLOURS}
+    present = {c: np.zeros((n, 64), bool) for c in COLOURS}
+    value = {c: np.zeros((n, 64), np.int16) for c in COLOURS}
+    king = {c: np.zeros((n, 64), bool) for c in COLOURS}
 
-def rate_cover(piece, coverage):
-    if isinstance(piece, King):
-        return -1000 if coverage < 0 else 0
-    else:
-        return piece.value * coverage
+    for c in COLOURS:
+        for p in board.pieces[c]:
+            sq = board.where[p].index
+
+            present[c][:, sq] = True
+            value[c][:, sq] = p.VALUE
+            king[c][:, sq] = isinstance(p, King)
+
+    def remove(k, c, sq):
+        present[c][k, sq] = False
+        value[c][k, sq] = 0
+        king[c][k, sq] = False
+
+    def place(k, p, sq):
+        present[p.colour][k, sq] = True
+        value[p.colour][k, sq] = p.VALUE
+        king[p.colour][k, sq] = isinstance(p, King)
+
+    for k, (x1, y1, x2, y2) in enumerate(candidates):
+        a, b = int(x1 * 8 + y1), int(x2 * 8 + y2)
+        piece, victim = flat[a].piece, flat[b].piece
+
+        changes = []
+
+        if victim and isinstance(piece, Pawn) and x1 == x2:
+            # a pawn pushing into a piece is taken itself, and the piece stays
+            occ = occupied & ~(1 << a)
+            changes.append((piece, sight[piece], 0))
+            remove(k, colour, a)
+            victim = None
+        else:
+            occ = occupied & ~(1 << a) | 1 << b
+            changes.append((piece, sight[piece], 1 << b | attacks(piece.shape, colour, b, occ)))
+            remove(k, colour, a)
+
+            if victim:
+                changes.append((victim, sight[victim], 0))
+                remove(k, victim.colour, b)
+
+            place(k, piece, b)
+
+        mask = 1 << a | 1 << b
+
+        for p, s in sliders:
+            if s & mask and p is not piece and p is not victim:
+                sq = board.where[p].index
+                changes.append((p, s, 1 << sq | attacks(p.shape, p.colour, sq, occ)))
+
+        for p, old, new in changes:
+            if old != new:
+                counts[p.colour][k] += _row(new) - _row(old)
+
+    score = {}
+    material = {}
+
+    for c in COLOURS:
+        # a piece always sees its own tile
+        coverage = counts[c] - 1 - counts[other(c)]
+        rating = np.where(king[c], np.where(coverage < 0, -1000, 0), value[c] * coverage)
+
+        score[c] = (rating * present[c]).sum(axis=1)
+        material[c] = value[c].sum(axis=1)
+
+    scores = score[colour] - score[enemy] + MATERIAL * (material[colour] - material[enemy])
+
+    own, theirs = king[colour].any(axis=1), king[enemy].any(axis=1)
+    scores = np.where(own & ~theirs, WIN, scores)
+    scores = np.where(~own & theirs, -WIN, scores)
+    scores = np.where(~own & ~theirs, 0, scores)
+
+    return scores
 
 
 class SubMax:
+    """
+    Keeps the n items with the highest scores, best first.
+    """
+
     def __init__(self, f, n):
-        self.scores = []
+        self.keys = []
         self.items = []
         self.n = n
         self.f = f
 
-    def add(self, item):
-        score = self.f(item)
+    @property
+    def scores(self):
+        return [-k for k in self.keys]
 
-        i = bisect.bisect_left(self.scores, score)
+    def add_batch(self, items, scores):
+        """
+        Add items with their scores computed beforehand, e.g. by batch_evaluate.
+        """
+        for i in np.argsort(-np.asarray(scores), kind="stable")[:self.n]:
+            self.add(items[i], scores[i])
+
+    def add(self, item, score=None):
+        key = -(self.f(item) if score is None else score)
+
+        i = bisect.bisect_right(self.keys, key)
         if i < self.n:
-            self.scores.insert(i, score)
+            self.keys.insert(i, key)
             self.items.insert(i, item)
 
-            if len(self.scores) > self.n:
-                del self.scores[-1]
+            if len(self.keys) > self.n:
+                del self.keys[-1]
                 del self.items[-1]
 
 
-def do_move(board, piece, x, y):
-    piece.x, old_x = x, piece.x
-    piece.x, old_y = y, piece.y
+def moves(board, colour):
+    return board.legal_moves(colour)
 
-    board[x, y].piece, old_piece = piece, board[x, y].piece
-    board[old_x, old_y].piece = None
-    piece.x, piece.y = x, y
-    board.pieces[old_piece.colour].remove(old_piece)
 
-    return old_piece, old_x, old_y
+Entry = namedtuple("Entry", ["key", "depth", "score", "flag", "move", "generation"])
 
 
-def undo_move(board, piece, x, y, old_piece, old_x, old_y):
-    board[x, y].piece = old_piece
-    board[old_x, old_y] = piece
-    piece.x, piece.y = old_x, old_y
-    board.pieces[old_piece.colour].append(old_piece)
+class TranspositionTable:
+    """
+    A fixed number of slots, indexed by the low bits of the position key.
+    An entry of the current search is only replaced by an entry searched at least as deep,
+    an entry of an earlier search is always replaced.
+    """
 
+    EXACT, LOWER, UPPER = 0, 1, 2
 
-def ai(board, colour, depth, width):
-    def f(move):
-        piece, x, y = move
+    def __init__(self, size=1 << 18):
+        size = 1 << (size - 1).bit_length()
 
-        old_piece, old_x, old_y = do_move(board, piece, x, y)
+        self.mask = size - 1
+        self.slots = [None] * size
+        self.generation = 0
 
-        score = covering_score(board)
-        score = score[colour] - sum(score[c] for c in score if c != colour)
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.replaced = 0
+        self.rejected = 0
 
-        undo_move(board, piece, x, y, old_piece, old_x, old_y)
+    def new_search(self):
+        self.generation += 1
 
-        return score
+    def probe(self, key):
+        entry = self.slots[key & self.mask]
 
-    if depth == 0:
-        width = 1
+        if entry and entry.key == key:
+            self.hits += 1
+            return entry
 
-    submax = SubMax(f, width)
+        self.misses += 1
+        return None
 
-    for piece in board.pieces[colour]:
-        for x, y in piece.moves():
-            submax.add((piece, x, y))
+    def store(self, key, depth, score, flag, move):
+        i = key & self.mask
+        entry = self.slots[i]
 
-    if depth > 0:
-        score_m = -1e10
-        move_m = ()
-        for move in submax.items:
-            undo = do_move(board, *move)
+        if entry and entry.key != key:
+            if entry.generation == self.generation and entry.depth > depth:
+                self.rejected += 1
+                return
 
-            score, move2 = ai(board, colour, depth - 1, width)
+            self.replaced += 1
 
-            undo_move(board, *move, *undo)
+        self.slots[i] = Entry(key, depth, score, flag, move, self.generation)
+        self.stores += 1
 
-            if score > score_m:
-                score_m = score
-                move_m = move2
+    def stats(self):
+        probes = self.hits + self.misses
 
-        return score_m, (move, move_m)
-    else:
-        return submax.scores[0], (submax.items[0], None)
+        return {"hits": self.hits, "misses": self.misses, "hit rate": self.hits / probes if probes else 0.0,
+                "stores": self.stores, "replaced": self.replaced, "rejected": self.rejected,
+                "filled": sum(e is not None for e in self.slots) / len(self.slots)}
+
+
+def to_table(score, ply):
+    return score + ply if score >= MATE else score - ply if score <= -MATE else score
+
+
+def from_table(score, ply):
+    return score - ply if score >= MATE else score + ply if score <= -MATE else score
+
+
+def tablebase_score(plies, ply):
+    """
+    :return: the score of a position at ply that ends plies later, see Tablebase.probe
+    """
+    return WIN - ply - plies if plies > 0 else -WIN + ply - plies if plies < 0 else 0
+
+
+class Timeout(Exception):
+    pass
+
+
+class Search:
+    """
+    Negamax with alpha-beta pruning, deepened one ply at a time until the time budget runs out.
+    Positions already searched deep enough are looked up in a transposition table, kept between searches.
+    """
+
+    def __init__(self, depth=32, budget=1.0, table_size=1 << 18, tablebase=None):
+        """
+        :param table_size: the number of transposition table slots, 0 to search without
+        :param tablebase: a tablebase.Tablebase to play the positions with few pieces from
+        """
+        self.depth = depth
+        self.budget = budget
+        self.table = TranspositionTable(table_size) if table_size else None
+        self.tablebase = tablebase
+
+        self.nodes = 0
+        self.reached = 0
+        self.results = []  # the best score and move after every completed depth
+        self.deadline = None
+        self.check = 0
+
+    def search(self, board, budget=None, root=None):
+        """
+        :param budget: the seconds to search for, instead of the budget of this searcher
+        :param root: the moves to choose from, instead of all moves
+        :return: the score and the best move found for the side to move
+        """
+        colour = board.turn
+        self.nodes = 0
+        self.reached = 0
+        self.results = []
+        self.deadline = time.perf_counter() + (self.budget if budget is None else budget)
+        self.check = 0
+
+        if self.table:
+            self.table.new_search()
+
+        known = self.tablebase.best_move(board) if self.tablebase and root is None else None
+
+        if known:
+            plies, move = known
+            self.results.append((tablebase_score(plies, 0), move))
+
+            return self.results[-1]
+
+        candidates = list(moves(board, colour)) if root is None else list(root)
+
+        submax = SubMax(None, len(candidates))
+        submax.add_batch(candidates, batch_evaluate(board, candidates) if candidates else [])
+
+        order = submax.items
+        best = submax.scores[0] if order else evaluate(board, colour), order[0] if order else None
+        self.results.append(best)
+
+        for depth in range(1, self.depth + 1):
+            try:
+                result = self.root(board, order, depth)
+            except Timeout:
+                break
+
+            best = result
+            self.reached = depth
+            self.results.append(best)
+
+            order.remove(best[1])
+            order.insert(0, best[1])
+
+            if abs(best[0]) >= WIN - self.depth:
+                break
+
+        return best
+
+    def root(self, board, order, depth):
+        alpha, beta = -WIN - 1, WIN + 1
+        best = alpha, None
+
+        for move in order:
+            board.make_move(*move)
+
+            try:
+                score = -self.negamax(board, depth - 1, -beta, -alpha, 1)
+            finally:
+                board.unmake_move()
+
+            if score > best[0]:
+                best = score, move
+
+            alpha = max(alpha, score)
+
+        return best
+
+    def negamax(self, board, depth, alpha, beta, ply):
+        self.nodes += 1
+
+        # look at the clock every 256 nodes, or after every batch of leaves
+        if self.nodes >= self.check:
+            self.check = self.nodes + 256
+
+            if time.perf_counter() > self.deadline:
+                raise Timeout()
+
+        colour = board.turn
+
+        if board.winner or depth == 0:
+            score = evaluate(board, colour)
+
+            # prefer winning sooner and losing later
+            return score - ply if score >= WIN else score + ply if score <= -WIN else score
+
+        plies = self.tablebase.probe(board) if self.tablebase else None
+
+        if plies is not None:
+            return tablebase_score(plies, ply)
+
+        table = self.table
+        key = board.key()
+        entry = table.probe(key) if table else None
+        hint = None
+        start = alpha
+
+        if entry:
+            hint = entry.move
+
+            if entry.depth >= depth:
+                score = from_table(entry.score, ply)
+
+                if entry.flag == TranspositionTable.EXACT:
+                    return score
+                elif entry.flag == TranspositionTable.LOWER:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
+
+                if alpha >= beta:
+                    return score
+
+        best = -WIN - 1
+        best_move = None
+        ordered = self.order(board, colour, hint)
+
+        if depth == 1 and ordered:
+            # the children are all leaves, rate them at once
+            scores = batch_evaluate(board, ordered)
+            self.nodes += len(ordered)
+
+            i = int(scores.argmax())
+            best, best_move = int(scores[i]), ordered[i]
+            best = best - ply - 1 if best >= WIN else best + ply + 1 if best <= -WIN else best
+            ordered = []
+
+        for move in ordered:
+            board.make_move(*move)
+
+            try:
+                score = -self.negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                board.unmake_move()
+
+            if score > best:
+                best = score
+                best_move = move
+
+                if score > alpha:
+                    alpha = score
+
+                    if alpha >= beta:
+                        break
+
+        if best == -WIN - 1:
+            return evaluate(board, colour)
+
+        if table:
+            if best <= start:
+                flag = TranspositionTable.UPPER
+            elif best >= beta:
+                flag = TranspositionTable.LOWER
+            else:
+                flag = TranspositionTable.EXACT
+
+            table.store(key, depth, to_table(best, ply), flag, best_move)
+
+        return best
+
+    def order(self, board, colour, hint=None):
+        """
+        Try the hinted move first, then captures, the most valuable victims first.
+        """
+        captures = []
+        quiet = []
+
+        for move in moves(board, colour):
+            victim = board.board[move[2], move[3]].piece
+
+            if victim and victim.colour != colour:
+                captures.append((-(WIN if isinstance(victim, King) else victim.VALUE), move))
+            else:
+                quiet.append(move)
+
+        captures.sort(key=lambda c: c[0])
+        ordered = [move for _, move in captures] + quiet
+
+        if hint in ordered:
+            ordered.remove(hint)
+            ordered.insert(0, hint)
+
+        return ordered
+
+
+instrument.watch(Search, "search", lambda result, searcher, *args, **kwargs: searcher.nodes, "nodes searched")
+instrument.watch(Search, "negamax")
+
+
+def sample(game, colour, rng, stay=0.75):
+    """
+    Build a position colour could be in, knowing only what it sees, what it remembers,
+    and how many pieces of each kind the enemy has left (as the kill counter shows).
+    The enemy pieces out of sight are put back where colour last saw them with probability stay,
+    and anywhere out of sight otherwise.
+
+    :return: a new game, with colour to move
+    """
+    enemy = other(colour)
+
+    board = Game(game.start_file)
+    board.engine = game.engine.__class__(board)
+    flat = list(board.board.flat)
+    real = list(game.board.flat)
+
+    def place(i, kind, c, h):
+        p = kind(board, c)
+
+        if h is not None:
+            p.hash = h
+
+        flat[i].set(p)
+        board.pieces[c].append(p)
+
+    hidden = Counter(p.__class__ for p in game.pieces[enemy])
+    visible = {t.index for t in game.visible[colour]}
+
+    for t in game.visible[colour]:
+        if t.piece:
+            place(t.index, t.piece.__class__, t.piece.colour, t.piece.hash)
+
+            if t.piece.colour == enemy:
+                hidden[t.piece.__class__] -= 1
+
+    # colour always sees its own pieces, so every tile out of sight is empty or holds an enemy piece
+    free = [i for i in range(64) if i not in visible]
+    ghosts = [i for i in free if real[i].memory[colour]]
+    rng.shuffle(ghosts)
+
+    for i in ghosts:
+        m = real[i].memory[colour]
+
+        if hidden[m.kind] > 0 and rng.random() < stay:
+            place(i, m.kind, enemy, m.hash)
+            hidden[m.kind] -= 1
+
+    for kind, n in hidden.items():
+        # pawns never stand on their own back row
+        back = 0 if enemy == Piece.BLACK else 7
+        tiles = [i for i in free if not flat[i].piece and not (kind is Pawn and i % 8 == back)]
+
+        for i in rng.sample(tiles, min(n, len(tiles))):
+            place(i, kind, enemy, None)
+
+    for t, r in zip(flat, real):
+        t.set_memory(colour, r.memory[colour])
+
+    for t in flat:
+        if t.piece:
+            board.look(t)
+
+    board.turn = colour
+    board.history = list(game.history)
+
+    return board
+
+
+class SampledSearch:
+    """
+    Searches the positions the side to move could be in instead of the real one, so it only uses what that side knows.
+    Every sampled position is searched for an equal share of the budget, and votes for its best move.
+    """
+
+    def __init__(self, samples=16, depth=32, budget=1.0, table_size=1 << 18, stay=0.75, seed=None, tablebase=None):
+        self.samples = samples
+        self.budget = budget
+        self.stay = stay
+
+        self.searcher = Search(depth, budget, table_size, tablebase)
+        self.rng = random.Random(seed)
+
+        self.nodes = 0
+        self.searched = 0
+
+    def search(self, game):
+        """
+        :return: the average score and the move with the most votes, ties broken by the total score
+        """
+        colour = game.turn
+        deadline = time.perf_counter() + self.budget
+
+        # the moves of colour only depend on what it sees, but a sample could still disagree if it is inconsistent
+        legal = set(moves(game, colour))
+        votes = {}
+
+        self.nodes = 0
+        self.searched = 0
+
+        for i in range(self.samples):
+            left = deadline - time.perf_counter()
+
+            if left <= 0 and votes:
+                break
+
+            board = sample(game, colour, self.rng, self.stay)
+            score, move = self.searcher.search(board, left / (self.samples - i))
+
+            self.nodes += self.searcher.nodes
+            self.searched += 1
+
+            if move in legal:
+                n, total = votes.get(move, (0, 0))
+                votes[move] = n + 1, total + score
+
+        if not votes:
+            return evaluate(game, colour), next(iter(legal), None)
+
+        move = max(votes, key=votes.get)
+        n, total = votes[move]
+
+        return total / n, move
+
+
+_searcher = None
+
+
+def _search_share(data, root, depth, budget, table_size):
+    """
+    Search some of the root moves of a pickled game, in a worker process.
+    The worker keeps its searcher, and so its transposition table, between searches.
+
+    :return: the best score and move after every completed depth, and the number of nodes
+    """
+    global _searcher
+
+    if not _searcher or (_searcher.depth, _searcher.budget) != (depth, budget):
+        _searcher = Search(depth, budget, table_size)
+
+    _searcher.search(pickle.loads(data), root=root)
+
+    return _searcher.results, _searcher.nodes
+
+
+class ParallelSearch:
+    """
+    Splits the root moves over a pool of worker processes, each searching its share with its own transposition table.
+    The best move is taken at the deepest depth every worker completed.
+    """
+
+    def __init__(self, workers=None, depth=32, budget=1.0, table_size=1 << 18):
+        self.workers = workers or os.cpu_count()
+        self.depth = depth
+        self.budget = budget
+        self.table_size = table_size
+
+        self.pool = ProcessPoolExecutor(self.workers)
+
+        self.nodes = 0
+        self.reached = 0
+
+    def search(self, board):
+        """
+        :return: the score and the best move found for the side to move
+        """
+        root = list(moves(board, board.turn))
+
+        if not root:
+            return evaluate(board, board.turn), None
+
+        # the workers do not need the moves that led here
+        undo, board.undo = board.undo, []
+        data = pickle.dumps(board)
+        board.undo = undo
+
+        shares = [root[i::self.workers] for i in range(min(self.workers, len(root)))]
+        futures = [self.pool.submit(_search_share, data, share, self.depth, self.budget, self.table_size) for share in shares]
+        results = [f.result() for f in futures]
+
+        self.nodes = sum(nodes for _, nodes in results)
+        self.reached = min(len(r) for r, _ in results) - 1
+
+        return max((r[self.reached] for r, _ in results), key=lambda b: b[0])
+
+    def close(self):
+        self.pool.shutdown()
+
+
+class Opponent:
+    """
+    A computer player for colour, searching for budget seconds per move.
+    Without samples it searches a copy of the real game, with samples it only uses what it sees and remembers.
+    With workers it searches the real game in that many processes.
+    """
+
+    def __init__(self, colour, depth=32, budget=1.0, table_size=1 << 18, samples=None, workers=None, tablebase=None):
+        """
+        :param tablebase: a tablebase.Tablebase, not used by the searches in other processes
+        """
+        self.colour = colour
+
+        if samples:
+            self.searcher = SampledSearch(samples, depth, budget, table_size, tablebase=tablebase)
+        elif workers:
+            self.searcher = ParallelSearch(workers, depth, budget, table_size)
+        else:
+            self.searcher = Search(depth, budget, table_size, tablebase)
+
+        self.thinker = None
+
+    def prepare(self, game):
+        """
+        :return: the copy of game to search, which leaves the moves that led here behind, see Game.copy
+        """
+        if isinstance(self.searcher, SampledSearch):
+            # look at the board first, like a player would
+            game.vision(self.colour)
+
+        return game.copy()
+
+    def think(self, board):
+        score, move = self.searcher.search(board)
+
+        return move
+
+    def move(self, game):
+        return self.think(self.prepare(game))
+
+    def submit(self, game):
+        """
+        Start thinking about a move in the background, so the window keeps responding.
+
+        :return: a future of the move
+        """
+        if not self.thinker:
+            self.thinker = ThreadPoolExecutor(1)
+
+        return self.thinker.submit(self.think, self.prepare(game))
+
+    def close(self):
+        """
+        Stop the thread thinking in the background, and the worker processes.
+        """
+        if self.thinker:
+            self.thinker.shutdown(cancel_futures=True)
+            self.thinker = None
+
+        if isinstance(self.searcher, ParallelSearch):
+            self.searcher.close()
+
+
+def ai(board, colour, depth, budget=1.0):
+    """
+    :return: the score and the best move for colour, which must be the side to move on board
+    """
+    if board.turn != colour:
+        raise ValueError(f"Not the turn of {colour}")
+
+    return Search(depth, budget).search(board)
+
+
+def scaling(start_file, workers=(1, 2, 4), budget=2.0, engine="bitboard"):
+    """
+    Search the starting position of start_file in parallel.
+
+    :return: the nodes per second by the number of workers
+    """
+    game = Game(start_file, engine)
+    game.load()
+
+    rates = {}
+
+    for n in workers:
+        # start the workers with a short search, the real one gets a fresh table
+        searcher = ParallelSearch(n, budget=0.1)
+        searcher.search(game)
+        searcher.budget = budget
+
+        start = time.perf_counter()
+        searcher.search(game)
+        rates[n] = searcher.nodes / (time.perf_counter() - start)
+
+        searcher.close()
+
+    return rates
+
+
+if __name__ == "__main__":
+    counts = [n for n in [1, 2, 4, 8, 16, 32] if n <= os.cpu_count()]
+
+    for f in ["starting_board.txt", "starting_board_king_queens.txt"]:
+        for n, rate in scaling(f, counts).items():
+            print(f"{f}: {n} workers, {rate:.0f} nodes/s")
@@ -0,0 +1,240 @@
+import array
+import mmap
+import os
+import struct
+import sys
+
+from collections import namedtuple
+
+from pieces import *
+from game import *
+
+
+MAGIC = b"FOWA\x01\x00"
+
+# per game: the length of the start file name, the result, and the number of plies,
+# followed by the start file name, padded to an even length, and a 16-bit code for every move
+HEADER = struct.Struct("<BBI")
+OFFSET = struct.Struct("<Q")
+
+RESULTS = [None, Piece.WHITE, Piece.BLACK, "tie"]
+
+# the archive is little-endian, which is read in place on a little-endian machine
+LITTLE = sys.byteorder == "little"
+
+ArchivedGame = namedtuple("ArchivedGame", ["start_file", "winner", "codes"])
+
+
+def pack_move(move):
+    """
+    :param move: a move in history notation
+    :return: the move as the square index of its start times 64 plus the square index of its end
+    """
+    x1, y1, x2, y2 = parse_move(move)
+
+    return (x1 * 8 + y1) << 6 | (x2 * 8 + y2)
+
+
+def unpack_move(code):
+    start, end = code >> 6, code & 63
+
+    return format_move(start >> 3, start & 7, end >> 3, end & 7)
+
+
+def decode(buffer, typecode):
+    """
+    :param typecode: "H" for the codes of moves, "Q" for offsets
+    :return: the little-endian numbers in buffer as a memoryview, of buffer itself unless the byte order differs
+    """
+    if LITTLE:
+        return memoryview(buffer).cast(typecode)
+
+    numbers = array.array(typecode)
+    numbers.frombytes(buffer)
+    numbers.byteswap()
+
+    return memoryview(numbers)
+
+
+class Writer:
+    """
+    Appends games to an archive: the games to path, and where each starts to path.idx.
+    A game is in the archive once its offset is in the index, an interrupted append is written over by the next one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        if not os.path.exists(path) or not os.path.getsize(path):
+            with open(path, "wb") as f:
+                f.write(MAGIC)
+
+            open(path + ".idx", "wb").close()
+
+        self.data = open(path, "r+b")
+        self.index = open(path + ".idx", "ab")
+
+        if self.data.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not a game archive: {path}")
+
+        # an offset cut short is not part of the index, and the next ones are written in line again
+        self.count = os.path.getsize(path + ".idx") // OFFSET.size
+        self.index.truncate(self.count * OFFSET.size)
+        self.end = self.last_end()
+
+    def last_end(self):
+        if not self.count:
+            return len(MAGIC)
+
+        with open(self.path + ".idx", "rb") as f:
+            f.seek((self.count - 1) * OFFSET.size)
+            offset, = OFFSET.unpack(f.read(OFFSET.size))
+
+        self.data.seek(offset)
+        n, result, plies = HEADER.unpack(self.data.read(HEADER.size))
+
+        return offset + HEADER.size + n + n % 2 + 2 * plies
+
+    def append(self, start_file, history, winner=None):
+        """
+        :param history: the moves in history notation
+        :param winner: the colour of the winner, "tie", or None if the game was not finished
+        :return: the number of the game in the archive
+        """
+        name = start_file.encode()
+        moves = struct.pack(f"<{len(history)}H", *map(pack_move, history))
+
+        self.data.seek(self.end)
+        self.data.write(HEADER.pack(len(name), RESULTS.index(winner), len(history)) + name + b"\0" * (len(name) % 2) + moves)
+        self.data.truncate()
+        self.data.flush()
+
+        self.index.write(OFFSET.pack(self.end))
+        self.index.flush()
+
+        self.end = self.data.tell()
+        self.count += 1
+
+        return self.count - 1
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Archive:
+    """
+    Reads an archive written by Writer through memory maps, without reading more of it than is asked for.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"Not a game archive: {path}")
+
+        self.view = memoryview(self.data)
+
+        if os.path.getsize(path + ".idx"):
+            with open(path + ".idx", "rb") as f:
+                self.index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            self.offsets = decode(self.index, "Q")
+        else:
+            self.index = None
+            self.offsets = []
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        """
+        :return: the start file and the winner of game i, and its moves as a memoryview of codes, see pack_move
+        """
+        offset = self.offsets[i]
+        n, result, plies = HEADER.unpack_from(self.data, offset)
+
+        start = offset + HEADER.size
+        name = bytes(self.view[start:start + n]).decode()
+        start += n + n % 2
+
+        codes = decode(self.view[start:start + 2 * plies], "H")
+
+        return ArchivedGame(name, RESULTS[result], codes)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def moves(self, i):
+        """
+        :return: the moves of game i in history notation
+        """
+        return [unpack_move(c) for c in self[i].codes]
+
+    def replay(self, i, engine="bitboard"):
+        """
+        :return: game i, played from its start file
+        """
+        entry = self[i]
+        game = Game(entry.start_file, engine)
+        game.load()
+
+        for code in entry.codes:
+            start, end = code >> 6, code & 63
+            game.make_move(start >> 3, start & 7, end >> 3, end & 7)
+
+        return game
+
+    def close(self):
+        if self.index:
+            self.offsets.release()
+
+        self.offsets = []
+        self.view.release()
+
+        # a map stays open while the codes of its games are still in use, and closes once they are gone
+        for m in [self.data, self.index]:
+            try:
+                if m is not None:
+                    m.close()
+            except BufferError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def stats(path):
+    """
+    :return: the number of games, the wins of every result, and the number of plies
+    """
+    wins = {}
+    plies = 0
+
+    with Archive(path) as archive:
+        for entry in archive:
+            wins[entry.winner] = wins.get(entry.winner, 0) + 1
+            plies += len(entry.codes)
+
+        return len(archive), wins, plies
+
+
+__all__ = ["ArchivedGame", "pack_move", "unpack_move", "Writer", "Archive"]
+
+
+if __name__ == "__main__":
+    games, wins, plies = stats(sys.argv[1])
+    print(f"{games} games, {plies} plies, {wins}")
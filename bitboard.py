@@ -0,0 +1,239 @@
+import random
+
+from pieces import *
+from pieces import DIRECTIONS, DIAGONALS, STRAIGHTS, geometry
+
+
+# Squares are numbered x * 8 + y, the order of Game.board.flat.
+# A bitboard is an int with bit i set for every square i in it.
+
+
+def square(x, y):
+    return x * 8 + y
+
+
+def bits(bb):
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+def mask(squares):
+    bb = 0
+
+    for sq in squares:
+        bb |= 1 << sq
+
+    return bb
+
+
+GEOMETRY = geometry(8, 8)
+
+KNIGHT = [mask(s) for s in GEOMETRY.knight]
+KING = [mask(s) for s in GEOMETRY.king]
+PAWN = {c: [mask(s) for s in GEOMETRY.capture[c]] for c in [Piece.WHITE, Piece.BLACK]}
+PUSH = {c: [mask(s) for s in GEOMETRY.push[c]] for c in [Piece.WHITE, Piece.BLACK]}
+
+DIAGONAL = [DIRECTIONS[d] for d in DIAGONALS]
+ORTHOGONAL = [DIRECTIONS[d] for d in STRAIGHTS]
+
+# (rays, increasing) per direction, increasing rays are cut at their lowest blocker, the others at their highest
+RAYS = {d: ([mask(r[i]) for r in GEOMETRY.rays], d[0] * 8 + d[1] > 0) for i, d in enumerate(DIRECTIONS)}
+
+
+def slide(sq, occupied, directions):
+    """
+    Walk the rays from sq up to and including the first occupied square.
+
+    :param sq: the starting square
+    :param occupied: the bitboard of all pieces
+    :param directions: the directions to walk in
+    :return: the bitboard of the reached squares
+    """
+    bb = 0
+
+    for d in directions:
+        rays, increasing = RAYS[d]
+        ray = rays[sq]
+        blockers = ray & occupied
+
+        if blockers:
+            if increasing:
+                b = (blockers & -blockers).bit_length() - 1
+            else:
+                b = blockers.bit_length() - 1
+
+            ray ^= rays[b]
+
+        bb |= ray
+
+    return bb
+
+
+def attacks(shape, colour, sq, occupied):
+    """
+    :return: the bitboard of the squares a piece on sq sees, besides its own
+    """
+    if shape == Pawn.SHAPE:
+        return PAWN[colour][sq]
+    elif shape == Knight.SHAPE:
+        return KNIGHT[sq]
+    elif shape == King.SHAPE:
+        return KING[sq]
+    elif shape == Bishop.SHAPE:
+        return slide(sq, occupied, DIAGONAL)
+    elif shape == Rook.SHAPE:
+        return slide(sq, occupied, ORTHOGONAL)
+    elif shape == Queen.SHAPE:
+        return slide(sq, occupied, DIAGONAL + ORTHOGONAL)
+
+    return 0
+
+
+def pawn_moves(colour, sq, occupied):
+    return PAWN[colour][sq] & occupied | PUSH[colour][sq]
+
+
+class BitboardEngine:
+    """
+    Generates moves and vision from precomputed attack tables and the occupancy of the board,
+    instead of walking the pieces over the tiles.
+    """
+
+    def __init__(self, board):
+        self.board = board
+
+    def move_bitboard(self, tile):
+        p = tile.piece
+
+        if p.shape == Pawn.SHAPE:
+            return pawn_moves(p.colour, tile.index, self.board.occupied)
+
+        return attacks(p.shape, p.colour, tile.index, self.board.occupied)
+
+    def moves(self, tile):
+        return [divmod(sq, 8) for sq in bits(self.move_bitboard(tile))]
+
+    def is_valid_move(self, tile, x, y):
+        return bool(self.move_bitboard(tile) >> square(x, y) & 1)
+
+    def see(self, tile):
+        p = tile.piece
+        self.board.sight[p] = 1 << tile.index | attacks(p.shape, p.colour, tile.index, self.board.occupied)
+
+
+def reference(game, tile):
+    """
+    Work out what the piece on tile reaches and sees from the rules alone, stepping over the board square by square,
+    without the tables of geometry() that both engines are built on.
+
+    :return: the reached (x, y), and the bitboard of the seen squares
+    """
+    p = tile.piece
+    x, y = tile.x, tile.y
+    reached = []
+
+    def add(dx, dy):
+        if game.is_in_bounds(x + dx, y + dy):
+            reached.append((x + dx, y + dy))
+
+    if p.shape == Pawn.SHAPE:
+        dy = -1 if p.colour == Piece.WHITE else 1
+        seen = [(x + dx, y + dy) for dx in [-1, 1] if game.is_in_bounds(x + dx, y + dy)]
+
+        add(0, dy)
+
+        if y == (6 if p.colour == Piece.WHITE else 1):
+            add(0, 2 * dy)
+
+        reached += [(a, b) for a, b in seen if game.board[a, b].piece]
+    else:
+        if p.shape == Knight.SHAPE:
+            steps = [(dx, dy) for dx in [-2, -1, 1, 2] for dy in [-2, -1, 1, 2] if abs(dx) != abs(dy)]
+        elif p.shape == King.SHAPE:
+            steps = [(dx, dy) for dx in [-1, 0, 1] for dy in [-1, 0, 1] if dx or dy]
+        else:
+            steps = []
+
+        for dx, dy in steps:
+            add(dx, dy)
+
+        directions = {Bishop.SHAPE: DIAGONAL, Rook.SHAPE: ORTHOGONAL, Queen.SHAPE: DIAGONAL + ORTHOGONAL}
+
+        for dx, dy in directions.get(p.shape, []):
+            a, b = x + dx, y + dy
+
+            while game.is_in_bounds(a, b):
+                reached.append((a, b))
+
+                if game.board[a, b].piece:
+                    break
+
+                a, b = a + dx, b + dy
+
+        seen = reached
+
+    return reached, mask(square(a, b) for a, b in seen) | 1 << tile.index
+
+
+def parity(start_file, games=20, plies=80, seed=0):
+    """
+    Play random games and check that both engines agree with the rules worked out square by square, see reference,
+    on every move and every seen tile.
+
+    :return: the number of compared positions
+    """
+    from game import Game
+
+    rng = random.Random(seed)
+    positions = 0
+
+    for _ in range(games):
+        game = Game(start_file)
+        game.load()
+
+        walk = game.engine
+        bitboard = BitboardEngine(game)
+
+        for _ in range(plies):
+            tiles = [t for t in game.board.flat if t.piece]
+
+            for t in tiles:
+                expected, sight = reference(game, t)
+
+                for engine in [walk, bitboard]:
+                    name = engine.__class__.__name__
+                    a = sorted(engine.moves(t))
+                    assert a == sorted(expected), f"{start_file} {game.history}: {name} moves of {t.piece} on {t.x, t.y}: {a} != {sorted(expected)}"
+
+                    for x in range(8):
+                        for y in range(8):
+                            if (x, y) != (t.x, t.y):
+                                assert engine.is_valid_move(t, x, y) == ((x, y) in expected), f"{name} {t.piece} to {x, y}"
+
+                    game.engine = engine
+                    game.look(t)
+
+                    assert game.sight[t.piece] == sight, f"{start_file} {game.history}: {name} vision of {t.piece} on {t.x, t.y} differs"
+
+                game.engine = walk
+
+            positions += 1
+
+            moves = [(t, m) for t in tiles if t.piece.colour == game.turn for m in walk.moves(t)]
+            if not moves:
+                break
+
+            t, (x, y) = rng.choice(moves)
+            game.do_move(t.x, t.y, x, y)
+
+            if game.winner:
+                break
+
+    return positions
+
+
+if __name__ == "__main__":
+    for f in ["starting_board.txt", "starting_board_king_queens.txt", "starting_board_only_kings.txt"]:
+        print(f, parity(f), "positions agree")
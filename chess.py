@@ -1,15 +1,20 @@
-import socket
-import time
+import sys
 
 import tkinter as tk
-import numpy as np
-import itertools as itr
 
 from tkinter import font
 from pieces import *
+from game import *
+from record import Record
+from network import host, join, valid
+from events import *
+from bitboard import bits
 
+import instrument
 
-COLOURS = [Piece.BLACK, Piece.WHITE]
+
+PIECE_BLACK = '#000000'
+PIECE_WHITE = '#FFFFFF'
 
 TILE_BLACK = '#AF8521'
 TILE_WHITE = '#E2DA9C'
@@ -21,273 +26,306 @@ MEMORY_COLOUR = '#444444'
 
 REL_PIECE_SIZE = 0.75
 
-window = tk.Tk("chess")
-window.geometry("560x560")
 
+class Board(tk.Canvas):
+    """
+    Draws a Game on a canvas, and lets the players move by clicking.
+    """
 
-def grouper(iterable, n, fillvalue=None):
-    "Collect data into fixed-length chunks or blocks"
-    # grouper('ABCDEFG', 3, 'x') --> ABC DEF Gxx
-    args = [iter(iterable)] * n
-    return itr.zip_longest(fillvalue=fillvalue, *args)
+    def __init__(self, master, client, start_file, engine="walk"):
+        tk.Canvas.__init__(self, master=master)
+        self.bind("<Expose>", self.draw)
+        self.bind("<Button-1>", self._click)
+        self.bind("<Configure>", self.resize)
+        self.counter = None
 
+        self.client = client
 
-class Tile:
-    def __init__(self, x, y, board):
+        self.loaded = False
+        self.font = font.Font(family="Cambria", size=-80)
 
-        self.x = x
-        self.y = y
-        self.board = board
-        self.canvas_id = None
+        self.game = Game(start_file, engine)
+        self.listen(self.game)
 
-        self.piece = None
+        # the record of the game played on this board, which the replays are rebuilt from
+        self.record = None
+
+        # the items of the tiles and of what was remembered of them, by square index, so that they are kept for
+        # another game shown on this board
+        self.tiles = {}
+        self.items = {}
+        self.memories = {}
         self.do_memory = True
-        self.memory = {c: None for c in COLOURS}
-        self.taken = {c: None for c in COLOURS}
 
-        p = (self.x + self.y + 1) % 2
-        self.colour = "white" if p else "black"
+        # what was last sent to Tk, so that only changes are sent
+        self.fills = {}
+        self.texts = {}
+        self.positions = {}
+        self.shown = {}
+        self.overlap = False
 
-    def toggle_memory(self):
-        self.do_memory = not self.do_memory
+        # the tiles changed since the last drawing, None for all of them, for the colours it showed
+        self.dirty = None
+        self.colours = None
+        self.captured = []
 
-    def draw(self, on, dx, dy):
-        a, b = on.screen_coord(self.x, self.y)
+        self.calls = 0
+        self.redraw_calls = 0
+
+        self.turn = "wait"
+        self.waiting = []  # the colours shown between turns, none when the players share the screen
+        self.replay = None
+        self.replay_bar = None
+        self.result = None
 
-        c = TILE_WHITE if self.colour == "white" else TILE_BLACK
+        self._e1 = None
+        self._e2 = None
+        self.selection = None
 
-        self.canvas_id = on.create_rectangle(a, b, a + dx, b + dy, fill=c)
+    @property
+    def history(self):
+        return self.game.history
 
-    def load(self, piece):
-        self.memory[Piece.WHITE if piece.colour == Piece.BLACK else Piece.BLACK] = m = piece.copy(MEMORY_COLOUR)
-        self.set(piece)
-        self.place_on_screen(m)
+    def load(self):
+        self.loaded = True
+        self.game.load()
+        self.record = Record(self.game)
+        self.resize()
 
-    def see(self, by: Piece):
+    def set_game(self, game):
         """
-        Register this tile in the vision of by.
-
-        :param by: the seeing piece
-        :return: the seen piece
+        Show another game on this board, e.g. an earlier position of the same one.
         """
+        self.unlisten(self.game)
+        self.game = game
+        self.listen(game)
+        self.dirty = None
 
-        self.board.itemconfigure(self.canvas_id, fill=TILE_WHITE if self.colour == "white" else TILE_BLACK)
-
-        m = self.memory[by.colour]
-        if m:
-            if not self.piece or m.hash != self.piece.hash:
-                m.delete()
-
-                self.memory[by.colour] = self.piece.copy(MEMORY_COLOUR) if self.piece and self.piece.colour != by.colour else None
-                self.place_on_screen(self.memory[by.colour])
-
-        if self.piece:
-            self.board.seen[by.colour].add(self.piece)
+        if self.counter:
+            self.counter.watch(game)
 
-        return self.piece
+        if self.result:
+            self.delete(self.result)
+            self.result = None
 
-    def make_move(self, dx, dy):
-        return self.piece, (self.x + dx, self.y + dy)
+    def listen(self, game):
+        for kind in [MoveApplied, MoveUndone, PieceCaptured, VisibilityChanged, MemoryUpdated, GameOver]:
+            game.events.subscribe(kind, self.changed)
 
-    def move(self, piece: Piece, is_last=False):
+    def unlisten(self, game):
+        for kind in [MoveApplied, MoveUndone, PieceCaptured, VisibilityChanged, MemoryUpdated, GameOver]:
+            game.events.unsubscribe(kind, self.changed)
 
+    def changed(self, event):
         """
-        Try to move to and take on this tile if is_last,
-        else try to move through it.
-
-        :rtype: Piece, bool
-        :param piece: the moving piece
-        :param is_last: is this the last step?
-        :return: the piece in this tile, the possibility of this move
+        Keep track of the tiles to draw again.
         """
-        if is_last:
-            ret = None
-
-            if self.piece:
-                self.board.take(self.piece)
-                ret = self.taken.setdefault(self.piece.colour, self.piece)
-                self.piece.delete()
+        if isinstance(event, PieceCaptured):
+            self.captured.append(event.piece.hash)
 
-            self.set(piece)
+        if self.dirty is None:
+            return
 
-            return ret, True
+        if isinstance(event, MoveApplied):
+            self.dirty.update([event.start, event.end])
+        elif isinstance(event, PieceCaptured):
+            self.dirty.add(event.tile)
+        elif isinstance(event, VisibilityChanged):
+            flat = self.game.board.flat
+            self.dirty.update(flat[sq] for sq in bits(event.shown | event.hidden))
+        elif isinstance(event, MemoryUpdated):
+            self.dirty.add(event.tile)
         else:
-            if self.piece:
-                return self.piece, False
+            self.dirty = None
 
-            self.set(piece)
+    def toggle_memory(self):
+        self.do_memory = not self.do_memory
+        self.dirty = None
 
-            return None, True
+    def draw(self, event=None):
+        if not self.loaded:
+            self.load()
 
-    def set(self, piece):
-        self.piece = piece
-        self.place_on_screen(piece)
+        dx = self.winfo_width() / 8
+        dy = self.winfo_height() / 8
 
-    def offset(self, dx, dy):
-        return self.board.get_tile(self.x + dx, self.y + dy)
+        for t in self.game.board.flat:
+            a, b = self.screen_coord(t.x, t.y)
 
-    def set_state(self, colour, state):
-        if state == "hidden":
-            self.board.itemconfigure(self.canvas_id, fill=TILE_UNSEEN_WHITE if self.colour == "white" else TILE_UNSEEN_BLACK)
+            if t.index in self.tiles:
+                self.coords(self.tiles[t.index], a, b, a + dx, b + dy)
+            else:
+                c = TILE_WHITE if t.colour == "white" else TILE_BLACK
+                self.tiles[t.index] = self.create_rectangle(a, b, a + dx, b + dy, fill=c)
+                self.fills[t.index] = c
 
-        p = self.piece
-        if p:
-            if p.colour == colour:
-                p.set_state(state)
+        self.positions = dict.fromkeys(self.positions)
+        self.dirty = None
+        self.redraw()
 
-                if state == "normal":
-                    self.board.tag_raise(p.tag)
+    def resize(self, event=None):
+        dx = self.winfo_width() / 8
+        dy = self.winfo_height() / 8
 
-        m = self.memory[colour]
-        if m and self.do_memory:
-            m.set_state(state)
+        fontsize = -int(REL_PIECE_SIZE * min(dx, dy))
+        self.font.configure(size=fontsize)
 
-            if state == "normal":
-                self.board.tag_raise(m.tag)
+        self.draw()
 
-    def place_on_screen(self, piece):
-        if piece:
-            self.board.coords(piece.tag, self.board.screen_coord(self.x, self.y, True))
+    def create(self, text, x, y, colour, tag):
+        item = self.create_text(*self.screen_coord(x, y, True), font=self.font, text=text, fill=colour, state="hidden", tags=tag)
 
-    def valid(self, dx, dy):
-        return self.piece and self.piece.is_valid_move(self, dx, dy)
+        self.texts[item] = text
+        self.positions[item] = (x, y)
+        self.shown[item] = False
 
+        return item
 
-class Board(tk.Canvas):
-    def __init__(self, master, client, start_file, reinit=False):
-        if not reinit:
-            tk.Canvas.__init__(self, master=master)
-            self.bind("<Expose>", self.draw)
-            self.bind("<Button-1>", self._click)
-            self.bind("<Configure>", self.resize)
-            self.counter = None
-        else:
-            self.delete('all')
+    def create_text(self, *args, **kw):
+        self.calls += 1
+        return tk.Canvas.create_text(self, *args, **kw)
 
-        self.client = client
+    def create_rectangle(self, *args, **kw):
+        self.calls += 1
+        return tk.Canvas.create_rectangle(self, *args, **kw)
 
-        self.loaded = False
-        self.font = font.Font(family="Cambria", size=-80)
+    def itemconfigure(self, *args, **kw):
+        self.calls += 1
+        return tk.Canvas.itemconfigure(self, *args, **kw)
 
-        self.pieces = {Piece.WHITE: [], Piece.BLACK: []}
-        self.seen = {Piece.WHITE: set(), Piece.BLACK: set()}
-        self.board = np.array([[Tile(x, y, self) for y in range(8)] for x in range(8)])
+    def coords(self, *args):
+        self.calls += 1
+        return tk.Canvas.coords(self, *args)
 
-        self.turn = "wait"
-        self.history = []
+    def tag_raise(self, *args):
+        self.calls += 1
+        return tk.Canvas.tag_raise(self, *args)
 
-        self._e1 = None
-        self._e2 = None
-        self.selection = None
+    def delete(self, *args):
+        self.calls += 1
+        return tk.Canvas.delete(self, *args)
 
-        self.start_file = start_file
+    def set_state(self, colours):
+        """
+        Show the board as seen by colours: their own pieces, what they see, and what they remember.
+        Only the tiles that changed are looked at, unless other colours are shown than the last time.
 
-    def load(self):
-        self.loaded = True
-        self.resize()
+        :param colours: the colours whose vision is shown
+        """
+        game = self.game
+        full = self.dirty is None or list(colours) != self.colours
 
-        constructors = {p.SHAPE: p for p in Piece.pieces}
+        tiles = game.board.flat if full else self.dirty
+        items = {} if full else self.items
 
-        with open(self.start_file) as f:
-            text = f.read()
-        text = "".join(text.split())
-        lines = text.split(";")
+        self.dirty = set()
+        self.colours = list(colours)
 
-        for line in lines:
-            if not line:
-                continue
+        for t in tiles:
+            lit = any(t in game.visible[c] for c in colours)
 
-            colour, data = line.split(":")
-            c = Piece.BLACK if colour == "black" else Piece.WHITE
+            if lit:
+                fill = TILE_WHITE if t.colour == "white" else TILE_BLACK
+            else:
+                fill = TILE_UNSEEN_WHITE if t.colour == "white" else TILE_UNSEEN_BLACK
 
-            for pieces in data.split(","):
-                shape = pieces[0]
-                coords = pieces[1:]
+            if t.index in self.tiles and self.fills.get(t.index) != fill:
+                self.itemconfigure(self.tiles[t.index], fill=fill)
+                self.fills[t.index] = fill
 
-                piece = constructors[shape]
+            for c, m in t.memory.items():
+                self.place_memory(t, c, m, m is not None and c in colours and self.do_memory)
 
-                for x, y in grouper(coords, 2):
-                    x = ord(x) - ord('a')
-                    y = 8 - int(y)
+            p = t.piece
+            if p:
+                shown = p.colour in colours or any(p in game.seen[c] for c in colours)
+                items[p.hash] = self.place_on_screen(p, t, shown)
 
-                    p = piece(self, c)
-                    self.board[x, y].load(p)
-                    self.pieces.setdefault(p.colour, []).append(p)
+        gone = [p for p in self.items if p not in items] if full else [p for p in self.captured if p in items]
 
-    def is_in_bounds(self, x, y):
-        return 0 <= x < self.board.shape[0] and 0 <= y < self.board.shape[1]
+        for p in gone:
+            tag = self.items[p]
+            self.delete(tag)
+            del self.texts[tag]
+            del self.positions[tag]
+            del self.shown[tag]
+            items.pop(p, None)
 
-    def get_tile(self, x, y):
-        return self.board[x, y] if self.is_in_bounds(x, y) else None
+        self.items = items
+        self.captured = []
 
-    def draw(self, event=None):
-        if not self.loaded:
-            self.load()
+        # memories are drawn below the pieces, so that a piece is never hidden behind what was remembered of it
+        if self.overlap:
+            self.tag_raise("piece")
+            self.overlap = False
 
-        dx = self.winfo_width() / 8
-        dy = self.winfo_height() / 8
+    def place_on_screen(self, piece, tile, shown):
+        tag = self.items.get(piece.hash)
 
-        for x in range(8):
-            for y in range(8):
-                self.board[x, y].draw(self, dx, dy)
+        if tag is None:
+            colour = PIECE_WHITE if piece.colour == Piece.WHITE else PIECE_BLACK
+            tag = self.create(piece.APPEARANCE, tile.x, tile.y, colour, "piece")
 
-        for x in range(8):
-            for y in range(8):
-                piece = self.board[x, y].piece
-                if piece is None:
-                    continue
+        self.update_item(tag, tile, piece.APPEARANCE, shown)
 
-        self.redraw()
+        return tag
 
-    def resize(self, event=None):
-        dx = self.winfo_width() / 8
-        dy = self.winfo_height() / 8
+    def place_memory(self, tile, colour, memory, shown):
+        """
+        Show what colour remembers of tile, reusing the one item kept for this.
+        """
+        tag = self.memories.get((tile.index, colour))
 
-        fontsize = -int(REL_PIECE_SIZE * min(dx, dy))
-        self.font.configure(size=fontsize)
+        if tag is None:
+            if not memory:
+                return
 
-        for x in range(8):
-            for y in range(8):
-                piece = self.board[x, y].piece
+            tag = self.memories[tile.index, colour] = self.create(memory.kind.APPEARANCE, tile.x, tile.y, MEMORY_COLOUR, "memory")
+            self.overlap = True
 
-                self.board[x, y].place_on_screen(piece)
+        text = memory.kind.APPEARANCE if memory else self.texts[tag]
+        self.update_item(tag, tile, text, shown)
 
-                for mem_piece in self.board[x, y].memory.values():
-                    self.board[x, y].place_on_screen(mem_piece)
+    def update_item(self, tag, tile, text, shown):
+        if self.positions[tag] != (tile.x, tile.y):
+            self.coords(tag, self.screen_coord(tile.x, tile.y, True))
+            self.positions[tag] = (tile.x, tile.y)
 
-        self.redraw()
+        options = {}
 
-    def create(self, p, x, y, colour=None):
-        colour = p.colour if not colour else colour
+        if self.texts[tag] != text:
+            options["text"] = self.texts[tag] = text
 
-        return self.create_text(*self.screen_coord(x, y, True), font=self.font, text=p.APPEARANCE, fill=colour)
+        if self.shown[tag] != shown:
+            self.shown[tag] = shown
+            options["state"] = "normal" if shown else "hidden"
 
-    def set_state(self, colour, state):
-        for t in self.board.flat:
-            t.set_state(colour, state)
+        if options:
+            self.itemconfigure(tag, **options)
 
     def redraw(self, event=None):
+        calls = self.calls
         turn = self.turn
 
         if turn == "wait":
-            self.set_state(Piece.BLACK, "hidden")
-            self.set_state(Piece.WHITE, "hidden")
-        elif turn == Piece.WHITE:
-            self.set_state(Piece.BLACK, "hidden")
-            self.set_state(Piece.WHITE, "normal")
-
-            self.vision(Piece.WHITE)
-            for p in self.seen[Piece.WHITE]:
-                p.set_state("normal")
-        elif turn == Piece.BLACK:
-            self.set_state(Piece.BLACK, "normal")
-            self.set_state(Piece.WHITE, "hidden")
-
-            self.vision(Piece.BLACK)
-            for p in self.seen[Piece.BLACK]:
-                p.set_state("normal")
+            for c in self.waiting:
+                self.game.vision(c)
+
+            self.set_state(self.waiting)
+        elif turn in COLOURS:
+            self.game.vision(turn)
+            self.set_state([turn])
+        elif turn == "replay":
+            self.game.vision(Piece.BLACK)
+            self.game.vision(Piece.WHITE)
+            self.set_state(COLOURS)
         else:
-            ...
+            self.set_state(COLOURS)
+
+        if self.selection:
+            self.tag_raise(self.selection)
+
+        self.redraw_calls = self.calls - calls
 
     def _click(self, event):
         if self._e1:
@@ -295,12 +333,16 @@ class Board(tk.Canvas):
 
             x1, y1 = self.grid_coord(self._e1)
             x2, y2 = self.grid_coord(self._e2)
-            self.do_move(x1, y1, x2, y2)
 
             self.delete(self.selection)
             self.selection = None
             self._e1 = None
             self._e2 = None
+
+            if self.game.is_legal(x1, y1, x2, y2):
+                self.do_move(x1, y1, x2, y2)
+            else:
+                self.redraw()
         else:
             self._e1 = event
 
@@ -308,12 +350,11 @@ class Board(tk.Canvas):
             dx = self.winfo_width() / 8
             dy = self.winfo_height() / 8
 
-            p = self.board[x, y].piece
+            p = self.game.board[x, y].piece
 
             if p and p.colour == self.turn:
                 self.selection = self.create_text((x + 0.5) * dx, (y + 0.5) * dy, font=self.font, text=p.APPEARANCE, fill="red")
                 self.redraw()
-                self.tag_raise(self.selection)
             else:
                 self._e1 = None
 
@@ -327,135 +368,179 @@ class Board(tk.Canvas):
 
         return x / 8 * self.winfo_width(), y / 8 * self.winfo_height()
 
-    def vision(self, colour):
-        self.seen[colour] = set()
+    def play(self, moves, speed=2.0, replay=False):
+        """
+        Play moves one by one, speed seconds apart, without blocking the window.
+
+        :param replay: start over from the starting position, and show both sides
+        """
+        if self.replay:
+            self.replay.pause()
 
-        for t in self.board.flat:
-            if t.piece and t.piece.colour == colour:
-                t.piece.see(t)
+        record = None
 
-    def play(self, moves, speed=2.0, replay=False):
         if replay:
-            self.__init__(self.master, client=self.client, start_file=self.start_file, reinit=True)
-            self.load()
+            record = self.record
+            self.set_game(record.position(0))
 
             if self.counter:
                 self.counter.reset()
 
-            self.turn = Piece.WHITE
+            self.turn = "replay"
+            self.do_memory = False
 
-            for t in self.board.flat:
-                t.toggle_memory()
+        self.replay = Replay(self, moves, speed, record)
+        self.redraw()
+        self.replay.play()
 
-            self.set_state(Piece.WHITE, "normal")
-            self.set_state(Piece.BLACK, "normal")
-            self.draw()
+    def read_move(self, move):
+        self.do_move(*parse_move(move))
 
-        not_turn = Piece.BLACK if self.turn == Piece.WHITE else Piece.WHITE
+    def do_move(self, x1, y1, x2, y2):
+        if self.game.do_move(x1, y1, x2, y2):
+            self.turn = "wait"
+            self.client.end_turn()
 
-        for move in moves:
-            if not replay:
-                self.set_state(self.turn, "normal")
-                self.set_state(not_turn, "hidden")
+        self.redraw()
+        self.win()
 
-                self.vision(self.turn)
-            else:
-                self.set_state(Piece.WHITE, "hidden")
-                self.set_state(Piece.BLACK, "hidden")
-                self.set_state(Piece.WHITE, "normal")
-                self.set_state(Piece.BLACK, "normal")
-                self.vision(Piece.BLACK)
-                self.vision(Piece.WHITE)
+    def win(self):
+        winner = self.game.winner
+        shown = self.result
 
-            self.update()
-            self.update_idletasks()
-            time.sleep(speed)
+        if self.result:
+            ...
+        elif winner == Piece.WHITE:
+            self.notice("White wins!")
+        elif winner == Piece.BLACK:
+            self.notice("Black wins!")
+        elif winner == "tie":
+            self.notice("Tie!")
+
+        if winner:
+            self.turn = "end"
+            self.set_state(COLOURS)
 
-            self.read_move(move)
+        # the profile is written once a game is over, not again on every click after it
+        if winner and not shown:
+            instrument.dump()
 
-        if not replay:
-            self.set_state(self.turn, "normal")
-            self.set_state(not_turn, "hidden")
+    def notice(self, text):
+        """
+        Show text over the board, as the result of the game is.
+        """
+        if self.result:
+            self.delete(self.result)
 
-            self.vision(self.turn)
-        else:
-            self.set_state(Piece.WHITE, "hidden")
-            self.set_state(Piece.BLACK, "hidden")
-            self.set_state(Piece.WHITE, "normal")
-            self.set_state(Piece.BLACK, "normal")
-            self.vision(Piece.BLACK)
-            self.vision(Piece.WHITE)
+        self.result = self.create_text(300, 300, font=("Cambria", 20), text=text, fill="#FF0000")
 
-        self.win()
+    def set_counter(self, counter):
+        self.counter = counter
+        counter.watch(self.game)
 
-    def read_move(self, move):
-        x1, y1, x2, y2 = move
-        a = ord('a')
+    def set_replay_bar(self, bar):
+        self.replay_bar = bar
 
-        x1, x2 = ord(x1) - a, ord(x2) - a
-        y1, y2 = 8 - int(y1), 8 - int(y2)
 
-        self.do_move(x1, y1, x2, y2)
+instrument.watch(Board, "_click")
+instrument.watch(Board, "do_move")
+instrument.watch(Board, "redraw", lambda result, board, *args: board.redraw_calls, "Tk calls")
+instrument.watch(Board, "set_state")
 
-    def do_move(self, x1, y1, x2, y2):
-        if x1 == x2 and y1 == y2:
-            return
 
-        tile = self.board[x1, y1]
+class Replay:
+    """
+    Steps a board through a list of moves with Tk after callbacks,
+    and jumps to any move by rebuilding it from a record of the moves.
+    """
 
-        if not tile.piece:
-            return
+    def __init__(self, board, moves, speed=2.0, record=None):
+        self.board = board
+        self.moves = list(moves)
+        self.speed = speed
 
-        dx, dy = x2 - x1, y2 - y1
-        end = (x2, y2)
+        if not record:
+            record = Record(board.game.copy())
 
-        if tile.valid(dx, dy):
-            m = (-1, -1)
-            for _, m in tile.piece.path(tile, dx, dy):
-                ...
+            for move in self.moves:
+                record.game.read_move(move)
 
-            if np.array_equal(m, end):
-                tile.piece.transfer(tile, self.board[x2, y2])
+        self.record = record
+        self.turn = board.turn
 
-                self.history += [f"{chr(ord('a') + x1)}{8 - y1}{chr(ord('a') + x2)}{8 - y2}"]
+        self.ply = 0
+        self.playing = False
+        self.job = None
 
-                self.turn = "wait"
-                self.client.end_turn()
+    def play(self):
+        if self.ply == len(self.moves):
+            self.seek(0)
 
-        self.redraw()
-        self.win()
+        self.playing = True
+        self.schedule()
+        self.notify()
 
-    def win(self):
-        white = sum(p.shape == "K" for p in self.pieces[Piece.WHITE])
-        black = sum(p.shape == "K" for p in self.pieces[Piece.BLACK])
-
-        won = black == 0 or white == 0
-        if white > 0 and black == 0:
-            self.create_text(300, 300, font=("Cambria", 20), text="White wins!", fill="#FF0000")
-        elif white == 0 and black > 0:
-            self.create_text(300, 300, font=("Cambria", 20), text="Black wins!", fill="#FF0000")
-        elif white == 0 and black == 0:
-            self.create_text(300, 300, font=("Cambria", 20), text="Tie!", fill="#FF0000")
-
-        if won:
-            self.turn = "end"
+    def pause(self):
+        self.playing = False
+        self.cancel()
+        self.notify()
 
-            b = Pawn(self, Piece.BLACK)
-            w = Pawn(self, Piece.WHITE)
+    def toggle(self):
+        if self.playing:
+            self.pause()
+        else:
+            self.play()
 
-            for t in self.board.flat:
-                t.see(w)
-                t.see(b)
+    def set_speed(self, speed):
+        self.speed = speed
 
-            self.set_state(Piece.BLACK, "normal")
-            self.set_state(Piece.WHITE, "normal")
+        if self.playing:
+            self.schedule()
 
-    def take(self, piece):
-        if self.counter:
-            self.counter.increment(piece)
+    def schedule(self):
+        self.cancel()
+        self.job = self.board.after(int(self.speed * 1000), self.step)
 
-    def set_counter(self, counter):
-        self.counter = counter
+    def cancel(self):
+        if self.job:
+            self.board.after_cancel(self.job)
+            self.job = None
+
+    def step(self):
+        self.job = None
+
+        if self.ply < len(self.moves):
+            self.board.game.read_move(self.moves[self.ply])
+            self.ply += 1
+
+            self.board.redraw()
+            self.board.win()
+
+        if self.playing and self.ply < len(self.moves):
+            self.schedule()
+        else:
+            self.playing = False
+
+        self.notify()
+
+    def seek(self, ply):
+        """
+        Show the position after ply moves.
+        """
+        self.ply = ply
+        self.board.set_game(self.record.position(ply))
+        self.board.turn = self.turn
+
+        if self.board.counter:
+            self.board.counter.reset()
+
+        self.board.redraw()
+        self.board.win()
+        self.notify()
+
+    def notify(self):
+        if self.board.replay_bar:
+            self.board.replay_bar.show(self)
 
 
 class TurnButton(tk.Button):
@@ -464,20 +549,65 @@ class TurnButton(tk.Button):
 
         tk.Button.__init__(self, master, command=self.start_turn, textvariable=self.text)
         self.board = board
-        self.turn = Piece.WHITE
 
-        self.text.set(f"Start {self.turn} turn")
+        self.text.set(f"Start {self.board.game.turn} turn")
 
     def start_turn(self):
-        if self.board.turn == "wait":
-            self.board.turn = self.turn
-            self.turn = Piece.BLACK if self.turn == Piece.WHITE else Piece.WHITE
+        if self.board.client.thinking:
+            ...
+        elif self.board.turn == "wait":
+            self.board.turn = self.board.game.turn
             self.board.redraw()
-            self.text.set(f"Start {self.turn} turn")
+            self.text.set(f"Start {other(self.board.turn)} turn")
         elif self.board.turn == "end":
             self.board.play(self.board.history, replay=True)
 
 
+class ReplayBar(tk.Frame):
+    def __init__(self, master, board):
+        tk.Frame.__init__(self, master)
+
+        self.board = board
+        self.text = tk.StringVar()
+        self.text.set("Play")
+
+        self.button = tk.Button(self, command=self.toggle, textvariable=self.text)
+        self.button.grid(row=0, column=0, sticky='nsew')
+
+        self.ply = tk.Scale(self, orient=tk.HORIZONTAL, label="Move", from_=0, to=0, command=self.seek)
+        self.ply.grid(row=0, column=1, sticky='nsew')
+
+        self.speed = tk.Scale(self, orient=tk.HORIZONTAL, label="Seconds per move", from_=0.1, to=4.0, resolution=0.1, command=self.set_speed)
+        self.speed.set(2.0)
+        self.speed.grid(row=0, column=2, sticky='nsew')
+
+        self.columnconfigure(1, weight=1)
+
+        board.set_replay_bar(self)
+
+    def toggle(self):
+        if self.board.replay:
+            self.board.replay.toggle()
+
+    def seek(self, value):
+        replay = self.board.replay
+
+        if replay and int(value) != replay.ply:
+            replay.seek(int(value))
+
+    def set_speed(self, value):
+        replay = self.board.replay
+
+        if replay and float(value) != replay.speed:
+            replay.set_speed(float(value))
+
+    def show(self, replay):
+        self.text.set("Pause" if replay.playing else "Play")
+        self.ply.configure(to=len(replay.moves))
+        self.ply.set(replay.ply)
+        self.speed.set(replay.speed)
+
+
 class KillCounter(tk.Frame):
 
     class NumStringVar():
@@ -500,6 +630,7 @@ class KillCounter(tk.Frame):
 
         self.board = board
         self.mode = mode
+        self.game = None
         self.counter = {clr: {piece: KillCounter.NumStringVar(tk.StringVar()) \
                               for piece in Piece.pieces} for clr in COLOURS}
 
@@ -533,17 +664,35 @@ class KillCounter(tk.Frame):
                 self.counter[clr][piece].set(0)
 
         if self.mode == "remaining":
-            for tile in self.board.board.flat:
-                if tile.piece:
-                    p = tile.piece
-                    self.counter[p.colour][p.__class__].add(1)
+            for clr in COLOURS:
+                for p in self.board.game.pieces[clr]:
+                    self.counter[clr][p.__class__].add(1)
 
         for clr in COLOURS:
             for piece in Piece.pieces:
                 self.counter[clr][piece].update()
 
-    def increment(self, piece):
-        incr = -1 if self.mode == "remaining" else 1
+    def watch(self, game):
+        """
+        Count the pieces taken in game, instead of the game watched before.
+        """
+        if self.game:
+            self.game.events.unsubscribe(PieceCaptured, self.taken)
+            self.game.events.unsubscribe(MoveUndone, self.undone)
+
+        self.game = game
+        game.events.subscribe(PieceCaptured, self.taken)
+        game.events.subscribe(MoveUndone, self.undone)
+
+    def taken(self, event):
+        self.increment(event.piece)
+
+    def undone(self, event):
+        for piece in event.restored:
+            self.increment(piece, -1)
+
+    def increment(self, piece, n=1):
+        incr = -n if self.mode == "remaining" else n
         clr = piece.colour
         p = piece.__class__
 
@@ -552,34 +701,42 @@ class KillCounter(tk.Frame):
 
 
 class Client:
-    def __init__(self, client_mode="local", kill_counter=True):
+    """
+    The window of a game: the board, and in local mode the turn button, replay bar and kill counter.
+    """
+
+    def __init__(self, client_mode="local", kill_counter=True, opponent=None, connection=None,
+                 start_file="starting_board_only_kings.txt", engine="walk"):
+        """
+        :param opponent: a computer player for one of the colours in local mode, e.g. ai.Opponent
+        :param connection: the network.Connection to the other player in online mode, asked for if not given
+        """
         self.client_mode = client_mode
+        self.opponent = opponent
+        self.thinking = None
 
-        if client_mode == "online":
+        if client_mode == "online" and not connection:
             mode = input("Mode (host/client): ")
             if mode.lower() == "host":
                 offset = input("Port offset: ")
-                offset = int(offset)
-
-                s = socket.socket()
-                s.bind(('', 60000 + offset))
-                s.listen(1)
-
-                conn, addr = s.accept()
+                connection = host(int(offset))
             elif mode.lower() == "client":
-                host = input("Host address: ")
+                address = input("Host address: ")
                 offset = input("Port offset: ")
-                offset = int(offset)
-
-                s = socket.socket()
-                s.connect((host, 60000 + offset))
-                conn = s
+                connection = join(address, int(offset))
             else:
                 exit()
 
+        self.connection = connection
+
+        window = self.window = tk.Tk()
+        window.title("chess")
+        window.geometry("560x560")
+
         playfield = tk.Frame(window)
-        chessboard = Board(playfield, client=self, start_file='starting_board_only_kings.txt')
+        chessboard = Board(playfield, client=self, start_file=start_file, engine=engine)
         chessboard.load()
+        self.board = chessboard
 
         chessboard.grid(row=0, column=0, sticky='nsew')
         playfield.rowconfigure(0, weight=1)
@@ -591,8 +748,11 @@ class Client:
             controlbar = tk.Frame(window)
             turnbutton = TurnButton(controlbar, chessboard)
             turnbutton.grid(row=0, column=0, sticky='nsew')
+            replaybar = ReplayBar(controlbar, chessboard)
+            replaybar.grid(row=0, column=1, sticky='nsew')
             controlbar.rowconfigure(0, weight=1)
             controlbar.columnconfigure(0, weight=1)
+            controlbar.columnconfigure(1, weight=1)
             controlbar.grid(row=1, column=0, columnspan=2, sticky='nsew')
 
             if kill_counter:
@@ -610,13 +770,85 @@ class Client:
         window.rowconfigure(0, weight=8)
         window.rowconfigure(1, weight=1)
 
-        window.mainloop()
+        if client_mode == "online":
+            chessboard.waiting = [connection.colour]
+            chessboard.game.events.subscribe(MoveApplied, self.send)
+            self.show_turn()
+            self.board.after(20, self.poll)
+        else:
+            if opponent:
+                chessboard.waiting = [other(opponent.colour)]
+
+            self.end_turn()
+
+    def run(self):
+        try:
+            self.window.mainloop()
+        finally:
+            if self.opponent:
+                self.opponent.close()
 
     def end_turn(self):
         if self.client_mode == "local":
-            ...
+            game = self.board.game
+
+            if self.opponent and game.turn == self.opponent.colour and not game.winner:
+                # let the window show the last move before thinking
+                self.board.after(1, self.opponent_turn)
         else:
-            ...  # poll conn
+            self.show_turn()
+
+    def send(self, event):
+        # only the moves made here are sent, the others came in through the connection
+        if len(self.connection.moves) < len(event.game.history):
+            self.connection.send(event.move)
+
+    def show_turn(self):
+        board = self.board
+        game = board.game
+
+        if not game.winner:
+            board.turn = self.connection.colour if game.turn == self.connection.colour else "wait"
+            board.redraw()
+
+    def poll(self):
+        game = self.board.game
+
+        for move in self.connection.poll():
+            if not valid(game, other(self.connection.colour), move):
+                print(f"Illegal move from the other player: {move}", file=sys.stderr)
+                self.connection.close()
+
+                # nothing can be played any more, so say so instead of leaving the board as if waiting
+                self.board.turn = "wait"
+                self.board.notice("The other player made an illegal move,\nthe game is stopped")
+                self.board.redraw()
+                return
+
+            self.board.read_move(move)
+
+        self.board.after(20, self.poll)
+
+    def opponent_turn(self):
+        self.thinking = self.opponent.submit(self.board.game)
+        self.board.after(20, self.opponent_moved)
+
+    def opponent_moved(self):
+        if not self.thinking.done():
+            self.board.after(20, self.opponent_moved)
+            return
+
+        board = self.board
+        move = self.thinking.result()
+        self.thinking = None
+
+        if move:
+            board.do_move(*move)
+
+        if not board.game.winner:
+            board.turn = board.game.turn
+            board.redraw()
 
 
-c = Client(client_mode="local")
+if __name__ == "__main__":
+    Client(client_mode="local").run()
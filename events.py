@@ -0,0 +1,67 @@
+import sys
+
+from collections import namedtuple
+
+
+# what happens in a game, sent to the listeners of its kind in Game.events
+MoveApplied = namedtuple("MoveApplied", ["game", "move", "piece", "start", "end"])
+MoveUndone = namedtuple("MoveUndone", ["game", "move", "start", "end", "restored"])
+PieceCaptured = namedtuple("PieceCaptured", ["game", "piece", "tile"])
+VisibilityChanged = namedtuple("VisibilityChanged", ["game", "colour", "shown", "hidden"])  # bitboards of squares
+MemoryUpdated = namedtuple("MemoryUpdated", ["game", "colour", "tile", "memory"])
+GameOver = namedtuple("GameOver", ["game", "winner"])
+
+KINDS = [MoveApplied, MoveUndone, PieceCaptured, VisibilityChanged, MemoryUpdated, GameOver]
+
+
+class Events(dict):
+    """
+    The listeners of a game, by kind of event.
+    A kind is only in here while it has listeners, so that the game only builds the events someone listens to.
+    """
+
+    def subscribe(self, kind, listener):
+        if kind not in KINDS:
+            raise ValueError(f"Incorrect event kind: {kind}")
+
+        self.setdefault(kind, []).append(listener)
+
+    def unsubscribe(self, kind, listener):
+        listeners = self.get(kind, [])
+
+        if listener in listeners:
+            listeners.remove(listener)
+
+        if not listeners:
+            self.pop(kind, None)
+
+    def emit(self, event):
+        for listener in list(self.get(type(event), [])):
+            listener(event)
+
+
+def format_square(tile):
+    return f"{chr(ord('a') + tile.x)}{8 - tile.y}"
+
+
+def log(game, file=sys.stderr):
+    """
+    Print the moves, captures and the end of game as they happen.
+
+    :return: the listener, to unsubscribe it
+    """
+    def listener(event):
+        if isinstance(event, MoveApplied):
+            print(f"{len(event.game.history)}. {event.piece.colour} {event.piece.shape} {event.move}", file=file)
+        elif isinstance(event, PieceCaptured):
+            print(f"{event.piece.colour} {event.piece.shape} taken on {format_square(event.tile)}", file=file)
+        else:
+            print(f"{event.winner} wins" if event.winner != "tie" else "tie", file=file)
+
+    for kind in [MoveApplied, PieceCaptured, GameOver]:
+        game.events.subscribe(kind, listener)
+
+    return listener
+
+
+__all__ = ["MoveApplied", "MoveUndone", "PieceCaptured", "VisibilityChanged", "MemoryUpdated", "GameOver", "Events"]
@@ -0,0 +1,700 @@
+import random
+import itertools as itr
+
+from collections import namedtuple
+from pieces import *
+from pieces import geometry
+from bitboard import BitboardEngine, bits
+from events import *
+
+
+COLOURS = [Piece.BLACK, Piece.WHITE]
+
+
+def grouper(iterable, n, fillvalue=None):
+    "Collect data into fixed-length chunks or blocks"
+    # grouper('ABCDEFG', 3, 'x') --> ABC DEF Gxx
+    args = [iter(iterable)] * n
+    return itr.zip_longest(fillvalue=fillvalue, *args)
+
+
+# what a colour remembers of a piece: its class, colour and hash, without the piece itself
+Memory = namedtuple("Memory", ["kind", "colour", "hash"])
+
+
+def remember(piece):
+    return Memory(piece.__class__, piece.colour, piece.hash)
+
+
+def _keys(seed):
+    rng = random.Random(seed)
+    return {(p.SHAPE, c): [rng.getrandbits(64) for _ in range(64)] for p in Piece.pieces for c in COLOURS}
+
+
+# the byte code of a piece of a kind and colour, 0 for an empty square, and the kind and colour of a code
+CODES = {(p.SHAPE, c): 1 + 2 * i + (c == Piece.WHITE) for i, p in enumerate(Piece.pieces) for c in COLOURS}
+KINDS = [None] + [(p, c) for p in Piece.pieces for c in COLOURS]
+
+# where a Game.state holds the pieces, what either colour remembers, and whose turn it is
+MEMORY = {Piece.BLACK: 64, Piece.WHITE: 128}
+TURN = 192
+
+
+# Zobrist keys of a piece on a square, and of a remembered piece on a square, by (shape, colour)
+PIECE_KEYS = _keys(1)
+MEMORY_KEYS = _keys(2)
+WHITE_KEY = random.Random(3).getrandbits(64)
+
+
+def other(colour):
+    return Piece.BLACK if colour == Piece.WHITE else Piece.WHITE
+
+
+def parse_move(move):
+    """
+    Read a move in history notation, e.g. "e2e4".
+
+    :param move: the move string
+    :return: x1, y1, x2, y2 in board coordinates
+    """
+    x1, y1, x2, y2 = move
+    a = ord('a')
+
+    x1, x2 = ord(x1) - a, ord(x2) - a
+    y1, y2 = 8 - int(y1), 8 - int(y2)
+
+    return x1, y1, x2, y2
+
+
+def format_move(x1, y1, x2, y2):
+    return f"{chr(ord('a') + x1)}{8 - y1}{chr(ord('a') + x2)}{8 - y2}"
+
+
+class Tile:
+    __slots__ = ["x", "y", "index", "board", "piece", "memory", "taken", "colour"]
+
+    def __init__(self, x, y, board):
+        self.x = x
+        self.y = y
+        self.index = x * 8 + y
+        self.board = board
+
+        self.piece = None
+        self.memory = {c: None for c in COLOURS}
+        self.taken = {c: None for c in COLOURS}
+
+        p = (self.x + self.y + 1) % 2
+        self.colour = "white" if p else "black"
+
+    def load(self, piece):
+        self.set_memory(other(piece.colour), remember(piece))
+        self.set(piece)
+
+    def see(self, by: Piece):
+        """
+        Register this tile in the vision of by.
+
+        :param by: the seeing piece
+        :return: the seen piece
+        """
+
+        self.board.sight[by] |= 1 << self.index
+
+        return self.piece
+
+    def remember(self, colour):
+        """
+        Update the memory of colour with what is on this tile now.
+        """
+
+        m = self.memory[colour]
+        if m:
+            if not self.piece or m.hash != self.piece.hash:
+                if self.board.undo:
+                    self.board.undo[-1].memory.append((self, colour, m))
+
+                self.set_memory(colour, remember(self.piece) if self.piece and self.piece.colour != colour else None)
+
+                if self.board.record:
+                    self.board.record.remember(self, colour)
+
+    def make_move(self, dx, dy):
+        return self.piece, (self.x + dx, self.y + dy)
+
+    def move(self, piece: Piece, is_last=False):
+
+        """
+        Try to move to and take on this tile if is_last,
+        else try to move through it.
+
+        :rtype: Piece, bool
+        :param piece: the moving piece
+        :param is_last: is this the last step?
+        :return: the piece in this tile, the possibility of this move
+        """
+        if is_last:
+            ret = None
+
+            if self.piece:
+                self.board.take(self.piece)
+                ret = self.taken.setdefault(self.piece.colour, self.piece)
+                self.piece.delete()
+
+            self.set(piece)
+
+            return ret, True
+        else:
+            if self.piece:
+                return self.piece, False
+
+            self.set(piece)
+
+            return None, True
+
+    def set(self, piece):
+        if self.piece:
+            self.board.zobrist ^= PIECE_KEYS[self.piece.shape, self.piece.colour][self.index]
+
+        self.piece = piece
+
+        if self.board.legal:
+            self.board.legal = {}
+
+        if piece:
+            self.board.zobrist ^= PIECE_KEYS[piece.shape, piece.colour][self.index]
+            self.board.occupied |= 1 << self.index
+            self.board.where[piece] = self
+            self.board.state[self.index] = CODES[piece.shape, piece.colour]
+        else:
+            self.board.occupied &= ~(1 << self.index)
+            self.board.state[self.index] = 0
+
+        for c in COLOURS:
+            self.board.stale[c] |= 1 << self.index
+
+    def set_memory(self, colour, memory):
+        """
+        Set what colour remembers of this tile.
+        """
+        old = self.memory[colour]
+
+        if old:
+            self.board.memory_zobrist[colour] ^= MEMORY_KEYS[old.kind.SHAPE, old.colour][self.index]
+
+        self.memory[colour] = memory
+
+        if memory:
+            self.board.memory_zobrist[colour] ^= MEMORY_KEYS[memory.kind.SHAPE, memory.colour][self.index]
+            self.board.state[MEMORY[colour] + self.index] = CODES[memory.kind.SHAPE, memory.colour]
+        else:
+            self.board.state[MEMORY[colour] + self.index] = 0
+
+        if MemoryUpdated in self.board.events:
+            self.board.events.emit(MemoryUpdated(self.board, colour, self, memory))
+
+    def valid(self, dx, dy):
+        return self.piece and self.piece.is_valid_move(self, dx, dy)
+
+
+class Grid:
+    """
+    The tiles of a game, indexed by [x, y], and as a flat list in the order of their square indices.
+    """
+
+    __slots__ = ["flat", "shape"]
+
+    def __init__(self, board):
+        self.flat = [Tile(x, y, board) for x in range(8) for y in range(8)]
+        self.shape = (8, 8)
+
+    def __getitem__(self, xy):
+        x, y = xy
+
+        return self.flat[x * 8 + y]
+
+
+class Undo:
+    """
+    Everything a move changed, besides what follows from the pieces on its tiles.
+    """
+
+    __slots__ = ["start", "end", "piece", "captured", "memory", "stale", "seen", "turn", "winner", "legal"]
+
+    def __init__(self, game, start, end):
+        self.start = start
+        self.end = end
+        self.piece = start.piece
+
+        self.captured = []  # (piece, index in the pieces of its colour, tile, what that tile had taken of its colour)
+        self.memory = []  # (tile, colour, memory)
+
+        self.stale = dict(game.stale)
+        self.seen = dict(game.seen)
+        self.turn = game.turn
+        self.winner = game.winner
+        self.legal = game.legal
+
+
+class WalkEngine:
+    """
+    Generates moves and vision by walking the pieces over the tiles.
+    """
+
+    def __init__(self, board):
+        self.board = board
+
+    def moves(self, tile):
+        moves = set()
+
+        for _, (x, y) in tile.piece.moves(tile):
+            if (x, y) != (tile.x, tile.y) and self.board.is_in_bounds(x, y) and self.is_valid_move(tile, x, y):
+                moves.add((x, y))
+
+        return list(moves)
+
+    def is_valid_move(self, tile, x, y):
+        dx, dy = x - tile.x, y - tile.y
+
+        if not tile.valid(dx, dy):
+            return False
+
+        m = (-1, -1)
+        for _, m in tile.piece.path(tile, dx, dy):
+            ...
+
+        return m == (x, y)
+
+    def see(self, tile):
+        tile.piece.see(tile)
+
+
+ENGINES = {"walk": WalkEngine, "bitboard": BitboardEngine}
+
+
+class Game:
+    """
+    The state of a game of fog of war chess, without any drawing.
+    """
+
+    def __init__(self, start_file, engine="walk"):
+        if engine not in ENGINES:
+            raise ValueError(f"Incorrect engine keyword: {engine}")
+
+        self.start_file = start_file
+        self.engine = ENGINES[engine](self)
+        self.occupied = 0
+
+        self.pieces = {Piece.WHITE: [], Piece.BLACK: []}
+        self.seen = {Piece.WHITE: set(), Piece.BLACK: set()}
+        self.visible = {Piece.WHITE: set(), Piece.BLACK: set()}
+
+        # what every piece sees, how many pieces see each square, and the bitboard of tiles changed since the last vision
+        self.sight = {}
+        self.where = {}
+        self.counts = {c: [0] * 64 for c in COLOURS}
+        self.stale = {c: 0 for c in COLOURS}
+
+        # Zobrist keys of the pieces on the board, and of what either colour remembers
+        self.zobrist = 0
+        self.memory_zobrist = {c: 0 for c in COLOURS}
+
+        # the whole position in 193 bytes: the code of the piece on every square, of what either colour remembers of it,
+        # and whether it is the turn of white
+        self.state = bytearray(TURN + 1)
+
+        self.board = Grid(self)
+        self.geometry = geometry(*self.board.shape)
+
+        self.turn = Piece.WHITE
+        self.winner = None
+        self.history = []
+
+        self.record = None
+        self.undo = []
+
+        # the listeners of what happens in this game, see events.py
+        self.events = Events()
+
+        # the valid moves of either colour in this position, filled in when asked for and emptied when a tile changes
+        self.legal = {}
+
+    def load(self):
+        constructors = {p.SHAPE: p for p in Piece.pieces}
+
+        with open(self.start_file) as f:
+            text = f.read()
+        text = "".join(text.split())
+        lines = text.split(";")
+
+        for line in lines:
+            if not line:
+                continue
+
+            colour, data = line.split(":")
+            c = Piece.BLACK if colour == "black" else Piece.WHITE
+
+            for pieces in data.split(","):
+                shape = pieces[0]
+                coords = pieces[1:]
+
+                piece = constructors[shape]
+
+                for x, y in grouper(coords, 2):
+                    x = ord(x) - ord('a')
+                    y = 8 - int(y)
+
+                    p = piece(self, c)
+                    self.board[x, y].load(p)
+                    self.pieces.setdefault(p.colour, []).append(p)
+
+        for t in self.board.flat:
+            if t.piece:
+                self.look(t)
+
+    @property
+    def turn(self):
+        return Piece.WHITE if self.state[TURN] else Piece.BLACK
+
+    @turn.setter
+    def turn(self, colour):
+        self.state[TURN] = colour == Piece.WHITE
+
+    def pack(self):
+        """
+        :return: this position as bytes, see Game.state
+        """
+        return bytes(self.state)
+
+    def unpack(self, position):
+        """
+        Set up a position packed by pack, on a game that was not loaded.
+        The pieces get new hashes, what was remembered of them keeps none.
+        """
+        for t in self.board.flat:
+            if position[t.index]:
+                kind, colour = KINDS[position[t.index]]
+                p = kind(self, colour)
+
+                t.set(p)
+                self.pieces[colour].append(p)
+
+            for c in COLOURS:
+                if position[MEMORY[c] + t.index]:
+                    kind, colour = KINDS[position[MEMORY[c] + t.index]]
+                    t.set_memory(c, Memory(kind, colour, None))
+
+        for t in self.board.flat:
+            if t.piece:
+                self.look(t)
+
+        for c in COLOURS:
+            self.stale[c] = (1 << 64) - 1
+
+        self.state[TURN] = position[TURN]
+        self.win()
+
+    def copy(self):
+        """
+        Copy this game, to continue it without changing this one. The copy has no listeners, is not recorded,
+        and cannot take back the moves made before it.
+        """
+        game = Game(self.start_file)
+        game.engine = self.engine.__class__(game)
+        flat = game.board.flat
+        pieces = {}
+
+        # the pieces keep their hashes, so that what was remembered of them still matches, and their order,
+        # so that the moves come in the same order
+        for c in COLOURS:
+            for p in self.pieces[c]:
+                q = pieces[p] = p.__class__(game, c)
+                q.hash = p.hash
+
+                flat[self.where[p].index].set(q)
+                game.pieces[c].append(q)
+
+        for t, mine in zip(flat, self.board.flat):
+            for c in COLOURS:
+                t.set_memory(c, mine.memory[c])
+
+                if mine.taken[c]:
+                    q = t.taken[c] = mine.taken[c].__class__(game, c)
+                    q.hash = mine.taken[c].hash
+
+        for t in flat:
+            if t.piece:
+                game.look(t)
+
+        game.stale = dict(self.stale)
+        game.seen = {c: {pieces[p] for p in self.seen[c] if p in pieces} for c in COLOURS}
+        game.state[TURN] = self.state[TURN]
+        game.winner = self.winner
+        game.history = list(self.history)
+
+        if game.winner:
+            game.reveal()
+
+        return game
+
+    def __getstate__(self):
+        # the listeners and the record belong to the window, copies and pickles go without them,
+        # and without the move cache and the tables, which are shared
+        state = dict(self.__dict__)
+        state["events"] = Events()
+        state["record"] = None
+        state["legal"] = {}
+        del state["geometry"]
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.geometry = geometry(*self.board.shape)
+
+    def key(self):
+        """
+        :return: the Zobrist key of this position: the pieces, whose turn it is, and what the side to move remembers
+        """
+        return self.zobrist ^ self.memory_zobrist[self.turn] ^ (WHITE_KEY if self.turn == Piece.WHITE else 0)
+
+    def is_in_bounds(self, x, y):
+        return 0 <= x < self.board.shape[0] and 0 <= y < self.board.shape[1]
+
+    def get_tile(self, x, y):
+        return self.board[x, y] if self.is_in_bounds(x, y) else None
+
+    def look(self, tile):
+        """
+        Recompute what the piece on tile sees, and count it in the vision of its colour.
+        """
+        p = tile.piece
+        old = self.sight.get(p, 0)
+
+        self.sight[p] = 0
+        self.engine.see(tile)
+
+        self.count(p.colour, old, self.sight[p])
+
+    def forget(self, piece):
+        """
+        Remove what piece saw from the vision of its colour.
+        """
+        if piece in self.sight:
+            self.count(piece.colour, self.sight.pop(piece), 0)
+
+    def count(self, colour, old, new):
+        counts = self.counts[colour]
+        flat = self.board.flat
+        shown = hidden = 0
+
+        for sq in bits(old & ~new):
+            counts[sq] -= 1
+
+            if not counts[sq]:
+                self.visible[colour].discard(flat[sq])
+                hidden |= 1 << sq
+
+        for sq in bits(new & ~old):
+            counts[sq] += 1
+
+            if counts[sq] == 1:
+                self.visible[colour].add(flat[sq])
+                self.stale[colour] |= 1 << sq
+                shown |= 1 << sq
+
+        if (shown or hidden) and VisibilityChanged in self.events:
+            self.events.emit(VisibilityChanged(self, colour, shown, hidden))
+
+    def moved(self, *tiles):
+        """
+        Update the vision after the pieces on tiles changed:
+        the pieces now on them look again, as do the sliding pieces looking through them.
+        """
+        mask = 0
+        for t in tiles:
+            mask |= 1 << t.index
+
+        todo = {t for t in tiles if t.piece}
+
+        for p, s in self.sight.items():
+            if p.SLIDES and s & mask:
+                todo.add(self.where[p])
+
+        for t in todo:
+            self.look(t)
+
+    def vision(self, colour):
+        """
+        Let colour look at the board: update its memory of the tiles it sees,
+        and the pieces it sees.
+        """
+        if self.winner:
+            return
+
+        visible = self.visible[colour]
+        flat = self.board.flat
+
+        for sq in bits(self.stale[colour]):
+            if flat[sq] in visible:
+                flat[sq].remember(colour)
+
+        self.stale[colour] = 0
+        self.seen[colour] = {t.piece for t in visible if t.piece}
+
+    def reveal(self):
+        for colour in COLOURS:
+            for t in self.board.flat:
+                t.remember(colour)
+
+            self.visible[colour] = set(self.board.flat)
+            self.seen[colour] = {t.piece for t in self.board.flat if t.piece}
+
+    def legal_moves(self, colour):
+        """
+        :return: the valid moves (x1, y1, x2, y2) of colour, as the keys of a dict in the order of the tiles
+        """
+        moves = self.legal.get(colour)
+
+        if moves is None:
+            moves = {}
+
+            for t in self.board.flat:
+                if t.piece and t.piece.colour == colour:
+                    for x, y in self.engine.moves(t):
+                        moves[t.x, t.y, x, y] = None
+
+            self.legal[colour] = moves
+
+        return moves
+
+    def is_legal(self, x1, y1, x2, y2):
+        piece = self.is_in_bounds(x1, y1) and self.board[x1, y1].piece
+
+        return bool(piece) and (x1, y1, x2, y2) in self.legal_moves(piece.colour)
+
+    def read_move(self, move):
+        return self.do_move(*parse_move(move))
+
+    def do_move(self, x1, y1, x2, y2):
+        return self.make_move(x1, y1, x2, y2)
+
+    def make_move(self, x1, y1, x2, y2):
+        """
+        Move the piece on (x1, y1) to (x2, y2), if this is a valid move.
+        The move can be taken back with unmake_move.
+
+        :return: whether the move was made
+        """
+        if not self.is_legal(x1, y1, x2, y2):
+            return False
+
+        tile = self.board[x1, y1]
+        piece = tile.piece
+
+        if self.record:
+            self.record.begin()
+
+        end = self.board[x2, y2]
+        self.undo.append(Undo(self, tile, end))
+
+        piece.transfer(tile, end)
+        self.moved(tile, end)
+
+        if self.record:
+            self.record.moved(tile, end, piece)
+
+        self.history += [format_move(x1, y1, x2, y2)]
+        self.turn = other(piece.colour)
+
+        if MoveApplied in self.events:
+            self.events.emit(MoveApplied(self, self.history[-1], piece, tile, end))
+
+        # only taking a king ends the game
+        if any(p.shape == King.SHAPE for p, *_ in self.undo[-1].captured):
+            self.win()
+
+        return True
+
+    def unmake_move(self):
+        """
+        Take back the last move made, and what was remembered since.
+        """
+        u = self.undo.pop()
+        start, end = u.start, u.end
+
+        for t, c, m in reversed(u.memory):
+            t.set_memory(c, m)
+
+        if u.captured and u.captured[0][0] is u.piece:
+            start.set(u.piece)
+        else:
+            end.set(u.captured[0][0] if u.captured else None)
+            start.set(u.piece)
+
+        for p, i, t, taken in u.captured:
+            self.pieces[p.colour].insert(i, p)
+            t.taken[p.colour] = taken
+
+        self.moved(start, end)
+
+        if self.winner and not u.winner:
+            flat = self.board.flat
+
+            for c in COLOURS:
+                self.visible[c] = {flat[sq] for sq in range(64) if self.counts[c][sq]}
+
+        move = self.history.pop()
+        self.turn = u.turn
+        self.winner = u.winner
+        self.stale = u.stale
+        self.seen = u.seen
+        self.legal = u.legal
+
+        if self.record:
+            self.record.undo()
+
+        if MoveUndone in self.events:
+            self.events.emit(MoveUndone(self, move, start, end, [p for p, *_ in u.captured]))
+
+    def win(self):
+        """
+        Check if either king has been taken, and reveal the board when the game is over.
+
+        :return: the colour of the winner, "tie", or None if the game is not over
+        """
+        if self.winner:
+            return self.winner
+
+        white = sum(p.shape == King.SHAPE for p in self.pieces[Piece.WHITE])
+        black = sum(p.shape == King.SHAPE for p in self.pieces[Piece.BLACK])
+
+        if white > 0 and black == 0:
+            self.winner = Piece.WHITE
+        elif white == 0 and black > 0:
+            self.winner = Piece.BLACK
+        elif white == 0 and black == 0:
+            self.winner = "tie"
+
+        if self.winner:
+            self.reveal()
+
+            if GameOver in self.events:
+                self.events.emit(GameOver(self, self.winner))
+
+        return self.winner
+
+    def take(self, piece):
+        if self.undo:
+            t = self.where[piece]
+            self.undo[-1].captured.append((piece, self.pieces[piece.colour].index(piece), t, t.taken[piece.colour]))
+
+        self.forget(piece)
+
+        if self.record:
+            self.record.take(piece)
+
+        if PieceCaptured in self.events:
+            self.events.emit(PieceCaptured(self, piece, self.where[piece]))
+
+
+__all__ = ["COLOURS", "Game", "Tile", "Memory", "remember", "other", "parse_move", "format_move"]
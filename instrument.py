@@ -0,0 +1,178 @@
+import atexit
+import json
+import os
+import time
+
+from game import Game, WalkEngine
+import bitboard
+
+from bitboard import BitboardEngine
+from pieces import Piece
+
+
+# the functions that are counted and timed while profiling: owner, name, what to count and under which name,
+# whether to time it
+WATCHED = []
+
+# the unwrapped functions while profiling, and where to write the results
+originals = {}
+output = None
+
+counters = {}
+histograms = {}
+totals = {}
+
+
+def watch(owner, name, count=None, label=None, timed=True):
+    """
+    Count and time owner.name while profiling. Nothing is changed about it otherwise.
+
+    :param count: what a call adds to the counter, given its result and arguments, 1 by default
+    :param label: the name of the counter, "owner.name" by default
+    :param timed: keep a histogram of the time of every call, not for generators
+    """
+    WATCHED.append((owner, name, count, label, timed))
+
+    if output:
+        wrap(owner, name, count, label, timed)
+
+
+def wrap(owner, name, count, label, timed):
+    f = owner.__dict__[name]
+    key = f"{owner.__name__}.{name}"
+    counter = label or key
+
+    originals[owner, name] = f
+    counters.setdefault(counter, 0)
+
+    if timed:
+        histograms.setdefault(key, [0] * 64)
+        totals.setdefault(key, 0)
+
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter_ns()
+        result = f(*args, **kwargs)
+
+        if timed:
+            elapsed = time.perf_counter_ns() - start
+            histograms[key][elapsed.bit_length()] += 1
+            totals[key] += elapsed
+
+        counters[counter] += count(result, *args, **kwargs) if count else 1
+
+        return result
+
+    wrapper.__wrapped__ = f
+    wrapper.__name__ = f.__name__
+    wrapper.__doc__ = f.__doc__
+
+    setattr(owner, name, wrapper)
+
+
+def enable(path="profile.json"):
+    """
+    Start profiling, and write the results to path at the end of every game and at exit.
+    """
+    global output
+
+    if output:
+        return
+
+    output = path
+
+    for watched in WATCHED:
+        wrap(*watched)
+
+
+def disable():
+    global output
+
+    for (owner, name), f in originals.items():
+        setattr(owner, name, f)
+
+    originals.clear()
+    output = None
+
+
+def reset():
+    for key in counters:
+        counters[key] = 0
+
+    for key in histograms:
+        histograms[key] = [0] * 64
+        totals[key] = 0
+
+
+def summary():
+    """
+    :return: the counters, and per timed function its number of calls, its total time, the time most calls took at most,
+        and its histogram: the number of calls per power of two nanoseconds they took at most
+    """
+    timings = {}
+
+    for key, buckets in histograms.items():
+        calls = sum(buckets)
+
+        if not calls:
+            continue
+
+        percentiles = {}
+        seen = 0
+
+        for b, n in enumerate(buckets):
+            seen += n
+
+            for p in [50, 90, 99]:
+                if p not in percentiles and seen * 100 >= p * calls:
+                    percentiles[p] = (1 << b) / 1000
+
+        timings[key] = {
+            "calls": calls,
+            "total_ms": totals[key] / 1e6,
+            **{f"p{p}_us": t for p, t in percentiles.items()},
+            "histogram": {str(1 << b): n for b, n in enumerate(buckets) if n},
+        }
+
+    return {"counters": dict(counters), "timings": timings}
+
+
+def dump(path=None):
+    """
+    Write the summary to path, or to where it was asked for when profiling started. Nothing happens when not profiling.
+    """
+    path = path or output
+
+    if path:
+        with open(path, "w") as f:
+            json.dump(summary(), f, indent=2)
+
+
+def _tiles(result, game, tile):
+    return game.sight[tile.piece].bit_count()
+
+
+def _moves(result, engine, tile):
+    return len(result)
+
+
+def _rays(result, *args):
+    # Piece.slide(piece, tile, directions) for the walk engine, bitboard.slide(sq, occupied, directions) for the other
+    return len(args[-1])
+
+
+watch(Game, "make_move")
+watch(Game, "unmake_move")
+watch(Game, "legal_moves")
+watch(Game, "vision")
+watch(Game, "look", _tiles, "tiles seen")
+watch(WalkEngine, "moves", _moves, "moves generated")
+watch(BitboardEngine, "moves", _moves, "moves generated")
+watch(Piece, "slide", _rays, "rays walked", False)
+watch(bitboard, "slide", _rays, "rays walked", False)
+
+atexit.register(dump)
+
+
+# FOW_PROFILE=profile.json profiles any program
+if os.environ.get("FOW_PROFILE"):
+    enable(os.environ["FOW_PROFILE"])
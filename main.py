@@ -0,0 +1,140 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+# the most a fresh interpreter may take to import the rules, load the standard board and list its first valid move
+STARTUP_TARGET = 0.25
+
+STARTUP = """
+import sys, time
+start = time.perf_counter()
+from game import Game
+game = Game("starting_board.txt", "bitboard")
+game.load()
+next(iter(game.legal_moves(game.turn)))
+print(time.perf_counter() - start, *sorted(m for m in ["numpy", "tkinter"] if m in sys.modules))
+"""
+
+
+def gui(args):
+    import instrument
+    from chess import Client
+
+    if args.profile:
+        instrument.enable(args.profile)
+
+    opponent = None
+    connection = None
+
+    if args.ai:
+        from ai import Opponent
+        opponent = Opponent(args.ai, budget=args.budget, samples=args.samples)
+
+    if args.host:
+        from network import host
+        connection = host(args.port_offset)
+    elif args.join:
+        from network import join
+        connection = join(args.join, args.port_offset)
+
+    mode = "online" if connection else "local"
+    client = Client(mode, opponent=opponent, connection=connection, start_file=args.board, engine=args.engine)
+
+    if args.log:
+        import events
+        events.log(client.board.game)
+
+    client.run()
+
+
+def startup(runs=5):
+    """
+    Time a cold start in fresh interpreters, from nothing to the first valid move of the standard board.
+
+    :return: the median seconds, and the heavy modules that were imported along the way
+    """
+    times = []
+    heavy = set()
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", STARTUP], capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+        wall = time.perf_counter() - start
+
+        # the whole process, interpreter included, as a user would wait for it
+        times.append(wall)
+        heavy.update(out[1:])
+
+    return statistics.median(times), sorted(heavy)
+
+
+def bench(args):
+    if args.what == "startup":
+        seconds, heavy = startup()
+        ok = seconds <= STARTUP_TARGET and not heavy
+
+        print(f"cold start to the first valid move: {1000 * seconds:.0f} ms, target {1000 * STARTUP_TARGET:.0f} ms"
+              + (f", imported {', '.join(heavy)}" if heavy else "") + ("" if ok else " FAILED"))
+
+        return 0 if ok else 1
+    elif args.what == "perft":
+        import perft
+        return perft.main(args.rest)
+    elif args.what == "server":
+        import server
+        return server.main(["bench"] + args.rest)
+    else:
+        import ai
+        counts = [n for n in [1, 2, 4, 8, 16, 32] if n <= os.cpu_count()]
+
+        for n, rate in ai.scaling("starting_board.txt", counts).items():
+            print(f"{n} workers, {rate:.0f} nodes/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fog of war chess.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("gui", help="play in a window")
+    p.add_argument("board", nargs="?", default="starting_board_only_kings.txt", help="the starting board file")
+    p.add_argument("--engine", default="walk", choices=["walk", "bitboard"])
+    p.add_argument("--ai", default=None, choices=["white", "black"], help="let the computer play this colour")
+    p.add_argument("--budget", type=float, default=1.0, help="the seconds the computer thinks per move")
+    p.add_argument("--samples", type=int, default=None, help="let the computer only use what it sees")
+    p.add_argument("--host", action="store_true", help="play online as white, waiting for the other player")
+    p.add_argument("--join", default=None, metavar="ADDRESS", help="play online as black, joining the host")
+    p.add_argument("--port-offset", type=int, default=0)
+    p.add_argument("--profile", default=None, help="count and time the hot functions, and write them to this JSON file")
+    p.add_argument("--log", action="store_true", help="print the moves, captures and the end of the game")
+
+    commands.add_parser("server", help="host games for many players, see server.py", add_help=False)
+    commands.add_parser("selfplay", help="play AIs against each other, see selfplay.py", add_help=False)
+
+    p = commands.add_parser("bench", help="time the cold start, perft, the server or the parallel search")
+    p.add_argument("what", nargs="?", default="startup", choices=["startup", "perft", "server", "search"])
+
+    args, rest = parser.parse_known_args(argv)
+
+    if args.command == "gui":
+        if rest:
+            parser.error(f"unrecognized arguments: {' '.join(rest)}")
+
+        return gui(args)
+    elif args.command == "server":
+        import server
+        return server.main(rest)
+    elif args.command == "selfplay":
+        import selfplay
+        return selfplay.main(rest)
+    else:
+        args.rest = rest
+        return bench(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
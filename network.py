@@ -0,0 +1,321 @@
+import errno
+import random
+import select
+import socket
+import sys
+import time
+
+from pieces import *
+from game import *
+
+
+PORT = 60000
+
+
+class Connection:
+    """
+    The connection to the other player of an online game, that never blocks:
+    poll() is called from the Tk loop, or any other loop, and sends and receives whatever it can.
+
+    Moves are exchanged in history notation and numbered by ply, so they are sent without waiting for the other side,
+    sent again after a reconnection, and ignored when received twice. Either side says hello with the number of moves
+    it has on every (re)connection, and the other side answers with the moves it is missing.
+    A ping is sent when nothing else was, and a connection that stays silent for timeout seconds is dropped.
+    The listening side keeps listening, and the connecting side connects again every retry seconds.
+    """
+
+    def __init__(self, host, port, colour, listen=False, heartbeat=1.0, timeout=5.0, retry=0.5):
+        """
+        :param colour: the colour played on this side
+        :param listen: wait for the other side to connect, instead of connecting to it
+        """
+        self.host = host
+        self.port = port
+        self.colour = colour
+
+        self.heartbeat = heartbeat
+        self.timeout = timeout
+        self.retry = retry
+
+        # the moves of the game so far, of either side, and the moves of the other side not taken by poll yet
+        self.moves = []
+        self.received = []
+
+        self.sock = None
+        self.server = None
+        self.connected = False
+        self.inbox = b""
+        self.outbox = b""
+
+        self.last_heard = 0
+        self.last_sent = 0
+        self.last_try = -retry
+
+        self.rtt = None
+        self.connections = 0
+
+        if listen:
+            self.server = socket.socket()
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.server.bind((host, port))
+            self.server.listen(1)
+            self.server.setblocking(False)
+
+            self.port = self.server.getsockname()[1]
+
+    def send(self, move):
+        """
+        Send a move made on this side.
+        """
+        self.write("move", len(self.moves), move)
+        self.moves.append(move)
+
+    def poll(self):
+        """
+        Accept, connect, send, receive and check the heartbeat, as far as possible without waiting.
+
+        :return: the moves of the other side received since the last poll
+        """
+        now = time.monotonic()
+
+        if self.server:
+            self.accept(now)
+        elif not self.sock and now - self.last_try >= self.retry:
+            self.connect(now)
+
+        if self.sock:
+            try:
+                self.exchange(now)
+
+                if now - self.last_heard > self.timeout:
+                    raise TimeoutError("the other side went silent")
+
+                if self.connected and now - self.last_sent > self.heartbeat:
+                    self.write("ping", now)
+            except (OSError, ValueError):
+                self.drop()
+
+        moves = self.received
+        self.received = []
+
+        return moves
+
+    def accept(self, now):
+        try:
+            sock, addr = self.server.accept()
+        except BlockingIOError:
+            return
+
+        # the other side connected again before this side noticed it was gone
+        self.drop()
+        self.setup(sock, now, True)
+
+    def connect(self, now):
+        self.last_try = now
+
+        sock = socket.socket()
+        sock.setblocking(False)
+        error = sock.connect_ex((self.host, self.port))
+
+        if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            sock.close()
+            return
+
+        self.setup(sock, now, False)
+
+    def setup(self, sock, now, connected):
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        self.sock = sock
+        self.connected = connected
+        self.inbox = b""
+        self.outbox = b""
+        self.last_heard = now
+
+        if connected:
+            self.connections += 1
+
+        self.write("hello", self.colour, len(self.moves))
+
+    def drop(self):
+        if self.sock:
+            self.sock.close()
+
+        self.sock = None
+        self.connected = False
+        self.inbox = b""
+        self.outbox = b""
+
+    def close(self):
+        self.drop()
+
+        if self.server:
+            self.server.close()
+            self.server = None
+
+    def write(self, *words):
+        if self.sock:
+            self.outbox += (" ".join(map(str, words)) + "\n").encode()
+            self.last_sent = time.monotonic()
+
+    def exchange(self, now):
+        sock = self.sock
+        readable, writable, _ = select.select([sock], [sock] if self.outbox or not self.connected else [], [], 0)
+
+        if not self.connected:
+            if not writable:
+                return
+
+            error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if error:
+                raise ConnectionRefusedError(error, "could not connect")
+
+            self.connected = True
+            self.connections += 1
+            self.last_heard = now
+
+        if writable and self.outbox:
+            try:
+                n = sock.send(self.outbox)
+                self.outbox = self.outbox[n:]
+            except BlockingIOError:
+                pass
+
+        if readable:
+            try:
+                data = sock.recv(1 << 16)
+            except BlockingIOError:
+                return
+
+            if not data:
+                raise ConnectionResetError("the other side closed the connection")
+
+            self.last_heard = now
+            *lines, self.inbox = (self.inbox + data).split(b"\n")
+
+            for line in lines:
+                self.handle(line.decode(), now)
+
+    def handle(self, line, now):
+        command, *args = line.split()
+
+        if command == "hello":
+            colour, ply = args
+
+            if colour == self.colour:
+                raise ValueError(f"Both sides play {colour}")
+
+            for i in range(int(ply), len(self.moves)):
+                self.write("move", i, self.moves[i])
+        elif command == "move":
+            ply, move = args
+            ply = int(ply)
+
+            if ply == len(self.moves):
+                self.moves.append(move)
+                self.received.append(move)
+            elif ply > len(self.moves):
+                # a move went missing, so ask for everything after the last one here
+                self.write("hello", self.colour, len(self.moves))
+        elif command == "ping":
+            self.write("pong", *args)
+        elif command == "pong":
+            self.rtt = now - float(args[0])
+        else:
+            raise ValueError(f"Incorrect message: {line}")
+
+
+def valid(game, colour, move):
+    """
+    Check a move received from the other player, who plays colour.
+
+    :return: whether move is readable, and a valid move of a piece of colour on the turn of colour
+    """
+    if game.winner or game.turn != colour:
+        return False
+
+    try:
+        x1, y1, x2, y2 = parse_move(move)
+    except ValueError:
+        return False
+
+    piece = game.is_in_bounds(x1, y1) and game.board[x1, y1].piece
+
+    return bool(piece) and piece.colour == colour and game.is_legal(x1, y1, x2, y2)
+
+
+def host(offset=0, colour=Piece.WHITE, **kwargs):
+    return Connection("", PORT + offset, colour, listen=True, **kwargs)
+
+
+def join(address, offset=0, colour=Piece.BLACK, **kwargs):
+    return Connection(address, PORT + offset, colour, **kwargs)
+
+
+def check(start_file="starting_board_only_kings.txt", plies=40, seed=0):
+    """
+    Play a random game over localhost between two connections polled in turn, as two windows would,
+    while the connection is broken now and then, or goes silent.
+
+    :return: whether both sides ended up with the same game
+    """
+    rng = random.Random(seed)
+    server = Connection("127.0.0.1", 0, Piece.WHITE, listen=True, heartbeat=0.05, timeout=0.3, retry=0.05)
+    client = Connection("127.0.0.1", server.port, Piece.BLACK, heartbeat=0.05, timeout=0.3, retry=0.05)
+
+    sides = {Piece.WHITE: server, Piece.BLACK: client}
+    games = {}
+
+    for colour in COLOURS:
+        games[colour] = Game(start_file, "bitboard")
+        games[colour].load()
+
+    try:
+        while len(games[Piece.WHITE].history) < plies and not games[Piece.WHITE].winner:
+            for colour, connection in sides.items():
+                game = games[colour]
+
+                for move in connection.poll():
+                    if not valid(game, other(colour), move):
+                        raise ValueError(f"Illegal move from the other side: {move}")
+
+                    game.read_move(move)
+
+                if game.turn == colour and not game.winner and len(connection.moves) == len(game.history):
+                    move = rng.choice(list(game.legal_moves(colour)))
+                    game.make_move(*move)
+                    connection.send(game.history[-1])
+
+                    # break the connection, or let one side go silent long enough for the heartbeat to notice
+                    if rng.random() < 0.2:
+                        rng.choice([server, client]).drop()
+                    elif rng.random() < 0.05:
+                        time.sleep(0.4)
+
+            time.sleep(0.001)
+
+        # let the last move arrive
+        deadline = time.monotonic() + 2
+
+        while time.monotonic() < deadline and len(client.moves) != len(server.moves):
+            for colour, connection in sides.items():
+                for move in connection.poll():
+                    games[colour].read_move(move)
+    finally:
+        server.close()
+        client.close()
+
+    print(f"{len(games[Piece.WHITE].history)} plies over {client.connections} connections, "
+          f"round trip {1000 * (client.rtt or 0):.1f} ms")
+
+    return games[Piece.WHITE].history == games[Piece.BLACK].history
+
+
+__all__ = ["PORT", "Connection", "valid", "host", "join"]
+
+
+if __name__ == "__main__":
+    ok = all(check(seed=seed) for seed in range(4))
+    print("same games" if ok else "DIFFERENT GAMES")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,129 @@
+import argparse
+import sys
+import time
+
+from pieces import *
+from game import *
+
+import instrument
+
+
+# the recorded counts of every board up to a depth: perft, and vision perft (leaves, visible tiles of black and white)
+EXPECTED = {
+    "starting_board.txt": {
+        "depth": 3,
+        "perft": [40, 1561, 65307],
+        "vision": [(40, 1000, 1123), (1561, 43828, 43828), (65307, 1832153, 1998253)],
+    },
+    "starting_board_king_queens.txt": {
+        "depth": 2,
+        "perft": [162, 24979],
+        "vision": [(162, 9216, 9137), (24979, 1425101, 1424237)],
+    },
+    "starting_board_only_kings.txt": {
+        "depth": 3,
+        "perft": [24, 544, 11312],
+        "vision": [(24, 352, 385), (544, 8580, 8476), (11312, 174122, 190660)],
+    },
+}
+
+
+def perft(game, depth):
+    """
+    Count the positions depth moves from game. A game that is over is not played on.
+
+    :return: the number of leaves
+    """
+    if depth == 0 or game.winner:
+        return 1
+
+    nodes = 0
+
+    for move in game.legal_moves(game.turn):
+        game.make_move(*move)
+        nodes += perft(game, depth - 1)
+        game.unmake_move()
+
+    return nodes
+
+
+def vision_perft(game, depth):
+    """
+    Like perft, but the side to move looks at the board before every move, as a player would,
+    and the visible tiles of either colour are summed over the leaves.
+
+    :return: the number of leaves, the visible tiles of black and of white
+    """
+    if depth == 0 or game.winner:
+        return 1, len(game.visible[Piece.BLACK]), len(game.visible[Piece.WHITE])
+
+    game.vision(game.turn)
+    total = [0, 0, 0]
+
+    for move in game.legal_moves(game.turn):
+        game.make_move(*move)
+
+        for i, n in enumerate(vision_perft(game, depth - 1)):
+            total[i] += n
+
+        game.unmake_move()
+
+    return tuple(total)
+
+
+def run(start_file, depth, engine="bitboard"):
+    """
+    :return: the perft and vision perft counts for every depth up to depth, and the nodes per second of either
+    """
+    counts = {"perft": [], "vision": []}
+    rates = {"perft": 0, "vision": 0}
+
+    for name, f in [("perft", perft), ("vision", vision_perft)]:
+        nodes = 0
+        start = time.perf_counter()
+
+        for d in range(1, depth + 1):
+            game = Game(start_file, engine)
+            game.load()
+
+            n = f(game, d)
+            counts[name].append(n)
+            nodes += n if name == "perft" else n[0]
+
+        rates[name] = nodes / (time.perf_counter() - start)
+
+    return counts, rates
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count and time the positions a few moves deep from the starting boards.")
+    parser.add_argument("--engine", default="bitboard", choices=["walk", "bitboard"])
+    parser.add_argument("--depth", type=int, default=None, help="instead of the recorded depth, skips the check")
+    parser.add_argument("--profile", default=None, help="count and time the hot functions, and write them to this JSON file")
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        instrument.enable(args.profile)
+
+    failed = False
+
+    for start_file, expected in EXPECTED.items():
+        depth = args.depth or expected["depth"]
+        counts, rates = run(start_file, depth, args.engine)
+
+        if args.depth:
+            status = ""
+        elif counts == {"perft": expected["perft"], "vision": expected["vision"]}:
+            status = "ok"
+        else:
+            status = f"MISMATCH, expected {expected}"
+            failed = True
+
+        print(f"{start_file} depth {depth}: perft {counts['perft']} {rates['perft']:.0f} nodes/s, "
+              f"vision {counts['vision']} {rates['vision']:.0f} nodes/s {status}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
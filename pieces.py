@@ -1,63 +1,74 @@
-import numpy as np
-import itertools as itr
-
 from abc import ABC, abstractmethod
+from collections import namedtuple
+from functools import lru_cache
 
 
-PIECE_BLACK = '#000000'
-PIECE_WHITE = '#FFFFFF'
+# the directions of the rays: the diagonals, then the files and ranks
+DIRECTIONS = [(-1, -1), (-1, 1), (1, -1), (1, 1), (-1, 0), (1, 0), (0, -1), (0, 1)]
+DIAGONALS = range(0, 4)
+STRAIGHTS = range(4, 8)
 
+# per square index x * height + y: its coordinates, the squares a knight or king reaches, the squares a pawn of either
+# colour pushes to and takes on, and the squares on the ray in every direction, nearest first
+Geometry = namedtuple("Geometry", ["squares", "knight", "king", "push", "capture", "rays"])
 
-class PathIter:
-    def __init__(self, step, cond, ret):
-        self.step = step
-        self.cond = cond
-        self.ret = ret
 
-    def walk(self, star, rang=None):
-        if not rang:
-            rang = itr.count()
+def sign(n):
+    return (n > 0) - (n < 0)
 
-        star = np.array(star)
 
-        for k in rang:
-            yield self.ret(star, k), star.copy()
+@lru_cache()
+def geometry(width=8, height=8):
+    """
+    Build the neighbour and ray tables of a board.
+    """
+    def index(x, y):
+        return x * height + y
 
-            if not self.cond(star, k):
-                break
+    def inside(x, y):
+        return 0 <= x < width and 0 <= y < height
 
-            step = self.step(star, k)
-            star += step
+    def steps(x, y, offsets):
+        return tuple(index(x + dx, y + dy) for dx, dy in offsets if inside(x + dx, y + dy))
 
+    def ray(x, y, dx, dy):
+        r = []
+        x, y = x + dx, y + dy
 
-class BoardWalk(PathIter):
-    def __init__(self, direction):
-        self.board = None
-        self.piece = None
+        while inside(x, y):
+            r.append(index(x, y))
+            x, y = x + dx, y + dy
 
-        direction = np.array(direction)
+        return tuple(r)
 
-        def cond(star, k):
-            return self.board.is_in_bounds(*(star + direction)) and (k == 0 or not self.board.board[star[0], star[1]].piece)
+    knight = [(-2, -1), (-2, 1), (2, -1), (2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2)]
+    king = [(dx, dy) for dx in [-1, 0, 1] for dy in [-1, 0, 1] if dx or dy]
 
-        def step(star, k):
-            return direction
+    # white pawns walk up the board from the second to last row, black pawns down from the second row
+    forward = {Piece.WHITE: (-1, height - 2), Piece.BLACK: (1, 1)}
 
-        def ret(star, k):
-            return self.piece
+    squares = [(x, y) for x in range(width) for y in range(height)]
+    push = {c: [] for c in forward}
+    capture = {c: [] for c in forward}
 
-        PathIter.__init__(self, step, cond, ret)
+    for x, y in squares:
+        for c, (dy, start) in forward.items():
+            push[c].append(steps(x, y, [(0, dy)] + ([(0, 2 * dy)] if y == start else [])))
+            capture[c].append(steps(x, y, [(-1, dy), (1, dy)]))
 
-    def walk(self, tile, rang=None):
-        self.board = tile.board
-        self.piece = tile.piece
-        yield from PathIter.walk(self, [tile.x, tile.y], rang)
+    return Geometry(tuple(squares),
+                    tuple(steps(x, y, knight) for x, y in squares),
+                    tuple(steps(x, y, king) for x, y in squares),
+                    {c: tuple(s) for c, s in push.items()},
+                    {c: tuple(s) for c, s in capture.items()},
+                    tuple(tuple(ray(x, y, dx, dy) for dx, dy in DIRECTIONS) for x, y in squares))
 
 
 class Piece(ABC):
     SHAPE = "*"
     APPEARANCE = "*"
     VALUE = 0
+    SLIDES = False  # does what this piece sees depend on the other pieces?
 
     WHITE = "white"
     BLACK = "black"
@@ -65,24 +76,16 @@ class Piece(ABC):
     pieces = []
     i = 0
 
-    def __init__(self, board, colour, shape=None, colour_override=None):
+    __slots__ = ["board", "colour", "shape", "hash"]
+
+    def __init__(self, board, colour, shape=None):
         self.board = board
         self.colour = colour
         self.shape = shape or Piece.SHAPE
         self.hash = Piece.i
 
-        if not colour_override:
-            colour_override = PIECE_WHITE if colour == Piece.WHITE else PIECE_BLACK
-
-        self.tag = board.create(self, 0, 0, colour=colour_override)
-        self.set_state("hidden")
-
         Piece.i += 1
 
-    @abstractmethod
-    def copy(self, colour_override=False):
-        ...
-
     def is_valid_move(self, tile, dx, dy):
         x = tile.x + dx
         y = tile.y + dy
@@ -92,6 +95,45 @@ class Piece(ABC):
     def path(self, tile, dx, dy):
         yield tile.make_move(dx, dy)
 
+    def reach(self, tile, squares):
+        """
+        :return: the moves to squares
+        """
+        coords = tile.board.geometry.squares
+
+        for sq in squares:
+            yield self, coords[sq]
+
+    def slide(self, tile, directions):
+        """
+        Walk the rays from tile in directions, up to and including the first piece.
+
+        :return: the reached squares
+        """
+        rays = tile.board.geometry.rays[tile.index]
+        flat = tile.board.board.flat
+
+        for d in directions:
+            for sq in rays[d]:
+                yield sq
+
+                if flat[sq].piece:
+                    break
+
+    def walk(self, tile, dx, dy):
+        """
+        Walk the ray from tile towards (dx, dy), from tile itself up to (dx, dy) or the first piece.
+
+        :return: the moves along the way
+        """
+        yield self, (tile.x, tile.y)
+
+        d = DIRECTIONS.index((sign(dx), sign(dy)))
+        coords = tile.board.geometry.squares
+
+        for sq, _ in zip(self.slide(tile, [d]), range(max(abs(dx), abs(dy)))):
+            yield self, coords[sq]
+
     @abstractmethod
     def see(self, tile):
         ...
@@ -109,12 +151,7 @@ class Piece(ABC):
     def __str__(self):
         return self.__repr__()
 
-    def set_state(self, state):
-        self.board.itemconfigure(self.tag, state=state)
-        self.board.tag_raise(self.tag)
-
     def delete(self):
-        self.board.delete(self.tag)
         if self in self.board.pieces[self.colour]:
             self.board.pieces[self.colour].remove(self)
 
@@ -137,41 +174,26 @@ class Pawn(Piece):
     APPEARANCE = u"\u2659"
     VALUE = 0
 
-    def __init__(self, board, colour, colour_override=None):
-        Piece.__init__(self, board, colour, Pawn.SHAPE, colour_override)
+    __slots__ = ["dy"]
+
+    def __init__(self, board, colour):
+        Piece.__init__(self, board, colour, Pawn.SHAPE)
 
         self.dy = -1 if self.colour == Piece.WHITE else 1
 
     def see(self, tile):
         tile.see(self)
 
-        t = tile.offset(-1, self.dy)
-        if t:
-            t.see(self)
-
-        t = tile.offset(1, self.dy)
-        if t:
-            t.see(self)
+        flat = tile.board.board.flat
+        for sq in tile.board.geometry.capture[self.colour][tile.index]:
+            flat[sq].see(self)
 
     def moves(self, tile):
-        t = tile.offset(0, 2 * self.dy)
-        if t and tile.y == 6 if self.dy == -1 else tile.y == 1:
-            yield self, (tile.x, tile.y + 2 * self.dy)
-
-        t = tile.offset(0, self.dy)
-        if t:
-            yield self, (tile.x, tile.y + self.dy)
-
-        t = tile.offset(1, self.dy)
-        if t and t.piece:
-            yield self, (tile.x + 1, tile.y + self.dy)
+        geometry = tile.board.geometry
+        flat = tile.board.board.flat
 
-        t = tile.offset(-1, self.dy)
-        if t and t.piece:
-            yield self, (tile.x - 1, tile.y + self.dy)
-
-    def copy(self, colour_override=None):
-        return Pawn(self.board, self.colour, colour_override=colour_override)
+        yield from self.reach(tile, geometry.push[self.colour][tile.index])
+        yield from self.reach(tile, [sq for sq in geometry.capture[self.colour][tile.index] if flat[sq].piece])
 
     def can_take(self, dx, dy):
         return dx != 0
@@ -181,34 +203,28 @@ class Bishop(Piece):
     SHAPE = "L"
     APPEARANCE = u"\u2657"
     VALUE = 3
+    SLIDES = True
 
-    DIRS = {-1: {-1: BoardWalk([-1, -1]), 1: BoardWalk([-1, 1])}, 1: {-1: BoardWalk([1, -1]), 1: BoardWalk([1, 1])}}
+    __slots__ = []
 
-    def __init__(self, board, colour, colour_override=None):
-        Piece.__init__(self, board, colour, Bishop.SHAPE, colour_override)
+    def __init__(self, board, colour):
+        Piece.__init__(self, board, colour, Bishop.SHAPE)
 
     def is_valid_move(self, tile, dx, dy):
         return dx == dy or dx == -dy
 
     def path(self, tile, dx, dy):
-        r = max(abs(dx), abs(dy)) + 1
-
-        return Bishop.DIRS[np.sign(dx)][np.sign(dy)].walk(tile, range(r))
+        return self.walk(tile, dx, dy)
 
     def see(self, tile):
-        for a in Bishop.DIRS.values():
-            for walker in a.values():
-                for p, r in walker.walk(tile):
-                    t = tile.board.get_tile(*r)
-                    t.see(self)
+        tile.see(self)
 
-    def moves(self, tile):
-        for a in Bishop.DIRS.values():
-            for walker in a.values():
-                yield from walker.walk(tile)
+        flat = tile.board.board.flat
+        for sq in self.slide(tile, DIAGONALS):
+            flat[sq].see(self)
 
-    def copy(self, colour_override=False):
-        return Bishop(self.board, self.colour, colour_override=colour_override)
+    def moves(self, tile):
+        yield from self.reach(tile, self.slide(tile, DIAGONALS))
 
 
 class Knight(Piece):
@@ -216,60 +232,48 @@ class Knight(Piece):
     APPEARANCE = u"\u2658"
     VALUE = 3
 
-    def __init__(self, board, colour, colour_override=None):
-        Piece.__init__(self, board, colour, Knight.SHAPE, colour_override)
+    __slots__ = []
+
+    def __init__(self, board, colour):
+        Piece.__init__(self, board, colour, Knight.SHAPE)
 
     def see(self, tile):
         tile.see(self)
 
-        for move in self.moves(tile):
-            t = tile.board.get_tile(*move[1])
-
-            if t:
-                t.see(self)
+        flat = tile.board.board.flat
+        for sq in tile.board.geometry.knight[tile.index]:
+            flat[sq].see(self)
 
     def moves(self, tile):
-        for dx, dy in itr.chain(itr.product([-2, 2], [-1, 1]), itr.product([-1, 1], [-2, 2])):
-            yield tile.make_move(dx, dy)
-
-    def copy(self, colour_override=False):
-        return Knight(self.board, self.colour, colour_override=colour_override)
+        yield from self.reach(tile, tile.board.geometry.knight[tile.index])
 
 
 class Rook(Piece):
     SHAPE = "T"
     APPEARANCE = u"\u2656"
     VALUE = 5
+    SLIDES = True
 
-    DIRS = {0: {-1: BoardWalk([-1, 0]), 1: BoardWalk([1, 0])}, 1: {-1: BoardWalk([0, -1]), 1: BoardWalk([0, 1])}}  # TODO rooks never walk?
+    __slots__ = []
 
-    def __init__(self, board, colour, colour_override=None):
-        Piece.__init__(self, board, colour, Rook.SHAPE, colour_override)
+    def __init__(self, board, colour):
+        Piece.__init__(self, board, colour, Rook.SHAPE)
 
     def is_valid_move(self, tile, dx, dy):
         return dx == 0 or dy == 0
 
     def path(self, tile, dx, dy):
-        y = dx == 0
-        s = np.sign(dy) if y else np.sign(dx)
-        n = abs(dy) if y else abs(dx)
-
-        return Rook.DIRS[y][s].walk(tile, range(n + 1))
+        return self.walk(tile, dx, dy)
 
     def moves(self, tile):
-        for a in Rook.DIRS.values():
-            for b in a.values():
-                yield from b.walk(tile)
+        yield from self.reach(tile, self.slide(tile, STRAIGHTS))
 
     def see(self, tile):
-        for move in self.moves(tile):
-            t = tile.board.get_tile(*move[1])
-
-            if t:
-                t.see(self)
+        tile.see(self)
 
-    def copy(self, colour_override=False):
-        return Rook(self.board, self.colour, colour_override=colour_override)
+        flat = tile.board.board.flat
+        for sq in self.slide(tile, STRAIGHTS):
+            flat[sq].see(self)
 
 
 class Queen(Bishop, Rook):
@@ -277,14 +281,16 @@ class Queen(Bishop, Rook):
     APPEARANCE = u"\u2655"
     VALUE = 10
 
-    def __init__(self, board, colour, colour_override=None):
-        Piece.__init__(self, board, colour, Queen.SHAPE, colour_override)
+    __slots__ = []
+
+    def __init__(self, board, colour):
+        Piece.__init__(self, board, colour, Queen.SHAPE)
 
     def is_valid_move(self, tile, dx, dy):
         return Bishop.is_valid_move(self, tile, dx, dy) or Rook.is_valid_move(self, tile, dx, dy)
 
     def path(self, tile, dx, dy):
-        return Bishop.path(self, tile, dx, dy) if Bishop.is_valid_move(self, tile, dx, dy) else Rook.path(self, tile, dx, dy)
+        return self.walk(tile, dx, dy)
 
     def see(self, tile):
         Bishop.see(self, tile)
@@ -294,17 +300,16 @@ class Queen(Bishop, Rook):
         yield from Bishop.moves(self, tile)
         yield from Rook.moves(self, tile)
 
-    def copy(self, colour_override=False):
-        return Queen(self.board, self.colour, colour_override=colour_override)
-
 
 class King(Piece):
     SHAPE = "K"
     APPEARANCE = u"\u2654"
     VALUE = 0
 
-    def __init__(self, board, colour, colour_override=None):
-        Piece.__init__(self, board, colour, King.SHAPE, colour_override)
+    __slots__ = []
+
+    def __init__(self, board, colour):
+        Piece.__init__(self, board, colour, King.SHAPE)
 
     def is_valid_move(self, tile, dx, dy):
         return abs(dx) <= 1 and abs(dy) <= 1
@@ -312,19 +317,12 @@ class King(Piece):
     def see(self, tile):
         tile.see(self)
 
-        for move in self.moves(tile):
-            t = tile.board.get_tile(*move[1])
-
-            if t:
-                t.see(self)
+        flat = tile.board.board.flat
+        for sq in tile.board.geometry.king[tile.index]:
+            flat[sq].see(self)
 
     def moves(self, tile):
-        for dx, dy in itr.product([-1, 0, 1], repeat=2):
-            if dx or dy:
-                yield tile.make_move(dx, dy)
-
-    def copy(self, colour_override=False):
-        return King(self.board, self.colour, colour_override=colour_override)
+        yield from self.reach(tile, tile.board.geometry.king[tile.index])
 
 
 Piece.pieces += [Pawn, Knight, Bishop, Rook, Queen, King]
@@ -0,0 +1,157 @@
+from collections import namedtuple
+
+from pieces import *
+from game import *
+
+
+# a position after ply recorded moves: what is on and remembered of every square, by square index
+Snapshot = namedtuple("Snapshot", ["ply", "pieces", "memory", "taken", "turn", "winner"])
+
+# a move, what it took, and what either colour remembered differently afterwards, until the next move
+Delta = namedtuple("Delta", ["move", "start", "end", "piece", "captured", "memory"])
+
+
+class Record:
+    """
+    Records a game as a snapshot every few plies and a delta for every move,
+    so that any position of it can be rebuilt in a bounded number of steps.
+    """
+
+    def __init__(self, game, every=8):
+        self.game = game
+        self.every = every
+        self.history = list(game.history)
+
+        self.snapshots = []
+        self.deltas = []
+        self.captured = None
+
+        game.record = self
+
+    @property
+    def moves(self):
+        return [d.move for d in self.deltas]
+
+    def begin(self):
+        """
+        Called right before a move is made.
+        """
+        if len(self.deltas) == len(self.snapshots) * self.every:
+            self.snapshots.append(self.snapshot())
+
+        self.captured = None
+
+    def take(self, piece):
+        self.captured = remember(piece)
+
+    def moved(self, start, end, piece):
+        move = format_move(start.x, start.y, end.x, end.y)
+        self.deltas.append(Delta(move, start.index, end.index, remember(piece), self.captured, []))
+
+    def undo(self):
+        """
+        Called when the last move is taken back.
+        """
+        self.deltas.pop()
+
+        # a snapshot taken right before the move may be of a line that was left, it is taken again with the next move
+        if self.snapshots and self.snapshots[-1].ply >= len(self.deltas):
+            self.snapshots.pop()
+
+    def remember(self, tile, colour):
+        if self.deltas:
+            self.deltas[-1].memory.append((colour, tile.index, tile.memory[colour]))
+
+    def snapshot(self):
+        game = self.game
+        flat = list(game.board.flat)
+
+        pieces = tuple(remember(t.piece) if t.piece else None for t in flat)
+        memory = tuple(tuple(t.memory[c] for t in flat) for c in COLOURS)
+        taken = tuple((t.index, c, remember(p)) for t in flat for c, p in t.taken.items() if p)
+
+        return Snapshot(len(self.deltas), pieces, memory, taken, game.turn, game.winner)
+
+    def restore(self, snapshot):
+        """
+        Build the game in the position of snapshot.
+        """
+        game = Game(self.game.start_file)
+        game.engine = self.game.engine.__class__(game)
+        flat = list(game.board.flat)
+
+        for i, r in enumerate(snapshot.pieces):
+            if r:
+                p = r.kind(game, r.colour)
+                p.hash = r.hash
+
+                flat[i].set(p)
+                game.pieces[p.colour].append(p)
+
+        for c, memory in zip(COLOURS, snapshot.memory):
+            for t, m in zip(flat, memory):
+                t.set_memory(c, m)
+
+        for i, c, r in snapshot.taken:
+            p = r.kind(game, r.colour)
+            p.hash = r.hash
+            flat[i].taken[c] = p
+
+        # every tile is left stale: looking at a tile again never changes the memory, it only takes time
+        for t in flat:
+            if t.piece:
+                game.look(t)
+
+        for c in COLOURS:
+            game.stale[c] = (1 << 64) - 1
+
+        game.turn = snapshot.turn
+        game.winner = snapshot.winner
+        game.history = self.history + self.moves[:snapshot.ply]
+
+        if game.winner:
+            game.reveal()
+
+        return game
+
+    def apply(self, game, delta):
+        """
+        Redo a recorded move on game, without checking it again.
+        """
+        flat = game.board.flat
+        start, end = flat[delta.start], flat[delta.end]
+        piece = start.piece
+
+        if delta.captured and delta.captured.hash == piece.hash:
+            start.move(None, True)
+        else:
+            end.move(piece, True)
+            start.set(None)
+
+        game.moved(start, end)
+        game.history += [delta.move]
+        game.turn = other(piece.colour)
+        game.win()
+
+        for c, i, m in delta.memory:
+            flat[i].set_memory(c, m)
+
+    def position(self, ply):
+        """
+        Rebuild the game as it was after ply recorded moves, including what both colours remembered.
+        """
+        ply = min(ply, len(self.deltas))
+
+        if not self.snapshots:
+            return self.restore(self.snapshot())
+
+        k = min(ply // self.every, len(self.snapshots) - 1)
+        game = self.restore(self.snapshots[k])
+
+        for delta in self.deltas[self.snapshots[k].ply:ply]:
+            self.apply(game, delta)
+
+        return game
+
+
+__all__ = ["Snapshot", "Delta", "Record"]
@@ -0,0 +1,154 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+from pieces import *
+from game import *
+from ai import Search, SampledSearch, moves
+from archive import Writer
+
+
+def parse_settings(text):
+    """
+    Read AI settings, e.g. "budget=0.2,depth=6,samples=8".
+
+    :return: the keyword arguments of the searcher
+    """
+    settings = {}
+
+    for item in filter(None, text.split(",")):
+        key, value = item.split("=")
+
+        if key not in ["budget", "depth", "samples", "table_size"]:
+            raise ValueError(f"Incorrect AI setting: {key}")
+
+        settings[key] = float(value) if key == "budget" else int(value)
+
+    return settings
+
+
+def searcher(settings):
+    settings = dict(settings)
+    samples = settings.pop("samples", 0)
+
+    if samples:
+        return SampledSearch(samples, **settings)
+
+    return Search(**settings)
+
+
+def own(game, move):
+    target = game.board[move[2], move[3]].piece
+
+    return target and target.colour == game.turn
+
+
+def play(start_file, white, black, engine="bitboard", max_plies=200, random_plies=0, seed=0):
+    """
+    Play one game between two searchers.
+
+    :param random_plies: the number of random moves to open with, so games with the same settings differ
+    :return: the winner ("-" if the game was cut off), the history, the number of searched nodes
+    """
+    game = Game(start_file, engine)
+    game.load()
+
+    players = {Piece.WHITE: searcher(white), Piece.BLACK: searcher(black)}
+    rng = random.Random(seed)
+    nodes = 0
+
+    while not game.winner and len(game.history) < max_plies:
+        if len(game.history) < random_plies:
+            # taking your own pieces is allowed, but not a sensible opening
+            quiet = [m for m in moves(game, game.turn) if not own(game, m)]
+            move = rng.choice(quiet or [None])
+        else:
+            player = players[game.turn]
+
+            if isinstance(player, SampledSearch):
+                game.vision(game.turn)
+
+            score, move = player.search(game)
+            nodes += player.nodes
+
+        if not move:
+            break
+
+        game.make_move(*move)
+
+        # the moves are never taken back
+        game.undo.clear()
+
+    return game.winner or "-", game.history, nodes
+
+
+def _play(args):
+    return play(*args)
+
+
+def selfplay(start_file, games, white, black, output, workers=None, engine="bitboard", max_plies=200, random_plies=4,
+             archive=None):
+    """
+    Play games in parallel and write one line per game to output: its number, the winner, the number of plies,
+    and the moves in history notation.
+
+    :param archive: the path of a game archive to append the games to as well, see archive.Writer
+
+    :return: the number of games per second and of nodes per second
+    """
+    jobs = [(start_file, white, black, engine, max_plies, random_plies, i) for i in range(games)]
+    nodes = 0
+    wins = {}
+
+    start = time.perf_counter()
+
+    writer = archive and Writer(archive)
+
+    with ProcessPoolExecutor(workers or os.cpu_count()) as pool, open(output, "w") as f:
+        f.write(f"# {start_file} white={white} black={black} engine={engine}\n")
+
+        for i, (winner, history, n) in enumerate(pool.map(_play, jobs)):
+            f.write(f"{i}\t{winner}\t{len(history)}\t{' '.join(history)}\n")
+
+            if writer:
+                writer.append(start_file, history, None if winner == "-" else winner)
+
+            nodes += n
+            wins[winner] = wins.get(winner, 0) + 1
+
+    if writer:
+        writer.close()
+
+    seconds = time.perf_counter() - start
+
+    return games / seconds, nodes / seconds, wins
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play games between two AIs without a window.")
+    parser.add_argument("board", nargs="?", default="starting_board.txt", help="the starting board file")
+    parser.add_argument("-n", "--games", type=int, default=10)
+    parser.add_argument("-o", "--output", default="selfplay.txt")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="the number of processes, all cores by default")
+    parser.add_argument("--white", default="budget=0.1", help='AI settings, e.g. "budget=0.2,depth=6,samples=8"')
+    parser.add_argument("--black", default="budget=0.1")
+    parser.add_argument("--engine", default="bitboard", choices=["walk", "bitboard"])
+    parser.add_argument("--max-plies", type=int, default=200)
+    parser.add_argument("--random-plies", type=int, default=4)
+    parser.add_argument("--archive", default=None, help="a game archive to append the games to")
+    args = parser.parse_args(argv)
+
+    games, nodes, wins = selfplay(args.board, args.games, parse_settings(args.white), parse_settings(args.black),
+                                  args.output, args.workers, args.engine, args.max_plies, args.random_plies,
+                                  args.archive)
+
+    print(f"{args.games} games written to {args.output}: {wins}", file=sys.stderr)
+    print(f"{games:.2f} games/s, {nodes:.0f} nodes/s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
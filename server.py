@@ -0,0 +1,402 @@
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+from pieces import *
+from game import *
+from game import MEMORY, TURN
+from archive import Writer
+from events import *
+from bitboard import bits
+
+import instrument
+
+
+PORT = 60100
+
+ALL = (1 << 64) - 1
+
+
+class Table:
+    """
+    One game on the server, and the players seated at it.
+    Each player is only ever told what their colour sees and remembers.
+    """
+
+    def __init__(self, name, start_file, engine="bitboard"):
+        self.name = name
+        self.game = Game(start_file, engine)
+        self.game.load()
+
+        self.players = {}
+
+        # what was last sent to either colour of every square, and the bitboard of squares that may have changed since
+        self.views = {c: [None] * 64 for c in COLOURS}
+        self.dirty = {c: ALL for c in COLOURS}
+
+        for kind in [MoveApplied, VisibilityChanged, MemoryUpdated, GameOver]:
+            self.game.events.subscribe(kind, self.changed)
+
+    def changed(self, event):
+        if isinstance(event, MoveApplied):
+            for c in COLOURS:
+                self.dirty[c] |= 1 << event.start.index | 1 << event.end.index
+        elif isinstance(event, VisibilityChanged):
+            self.dirty[event.colour] |= event.shown | event.hidden
+        elif isinstance(event, MemoryUpdated):
+            self.dirty[event.colour] |= 1 << event.tile.index
+        else:
+            # the whole board is revealed
+            for c in COLOURS:
+                self.dirty[c] = ALL
+
+    def seat(self, writer, colour=None):
+        """
+        Seat a player, at colour or at the first free colour.
+
+        :return: the colour of the player, or None if there is no place
+        """
+        free = [c for c in [Piece.WHITE, Piece.BLACK] if c not in self.players]
+
+        if colour:
+            free = [c for c in free if c == colour]
+
+        if not free:
+            return None
+
+        colour = free[0]
+        self.players[colour] = writer
+        self.views[colour] = [None] * 64
+        self.dirty[colour] = ALL
+
+        return colour
+
+    def leave(self, colour):
+        self.players.pop(colour, None)
+
+    def view(self, colour):
+        """
+        :return: a view message with the squares that changed for colour since its last view:
+            their index, the code of the piece on it or x if it is not seen, and the code of what colour remembers of it
+        """
+        game = self.game
+        game.vision(colour)
+
+        visible = game.visible[colour]
+        state = game.state
+        last = self.views[colour]
+        flat = game.board.flat
+        changes = []
+
+        for sq in bits(self.dirty[colour]):
+            t = flat[sq]
+            seen = t in visible or t.piece and t.piece.colour == colour
+            square = (state[t.index] if seen else "x", state[MEMORY[colour] + t.index])
+
+            if last[t.index] != square:
+                last[t.index] = square
+                changes.append(f"{t.index}:{square[0]}:{square[1]}")
+
+        self.dirty[colour] = 0
+
+        return f"view {len(game.history)} {game.turn} {game.winner or '-'} {' '.join(changes)}"
+
+    def play(self, colour, move):
+        """
+        Make the move of colour, if it is the turn of colour and the move is valid.
+
+        :return: whether the move was made
+        """
+        game = self.game
+
+        if game.winner or game.turn != colour:
+            return False
+
+        try:
+            x1, y1, x2, y2 = parse_move(move)
+        except ValueError:
+            return False
+
+        piece = game.is_in_bounds(x1, y1) and game.board[x1, y1].piece
+
+        if not piece or piece.colour != colour or not game.make_move(x1, y1, x2, y2):
+            return False
+
+        # the moves are never taken back
+        game.undo.clear()
+
+        return True
+
+
+class Server:
+    """
+    Holds the games of many players, who only send moves and only receive their own view of their game.
+
+    The protocol is one line per message. A player sends "join <table> [colour]" once, and then "move e2e4".
+    The server answers with "start <colour>" and sends a view after every move, see Table.view,
+    or "error <reason>" if the move was not made.
+    """
+
+    def __init__(self, start_file="starting_board.txt", engine="bitboard", archive=None):
+        """
+        :param archive: the path of a game archive to append every finished game to, see archive.Writer
+        """
+        self.start_file = start_file
+        self.engine = engine
+        self.tables = {}
+        self.archive = archive and Writer(archive)
+
+        self.moves = 0
+        self.games = 0
+
+    async def serve(self, host="", port=PORT):
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def handle(self, reader, writer):
+        table = None
+        colour = None
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    # a line longer than the reader takes
+                    break
+
+                if not line:
+                    break
+
+                words = line.decode(errors="replace").split()
+
+                if not words:
+                    continue
+
+                command, *args = words
+
+                if command == "join" and not table and args[1:2] and args[1] not in COLOURS:
+                    writer.write(b"error colour\n")
+                elif command == "join" and not table and args:
+                    # a table is only kept once someone sits at it
+                    table = self.tables.get(args[0]) or Table(args[0], self.start_file, self.engine)
+                    colour = table.seat(writer, *args[1:2])
+
+                    if not colour:
+                        table = None
+                        writer.write(b"error full\n")
+                    else:
+                        self.tables[args[0]] = table
+                        writer.write(f"start {colour}\n{table.view(colour)}\n".encode())
+                elif command == "move" and table and args:
+                    if table.play(colour, args[0]):
+                        self.moved(table)
+                    else:
+                        writer.write(f"error illegal {args[0]}\n".encode())
+                elif command == "ping":
+                    writer.write(f"pong {' '.join(args)}\n".encode())
+                else:
+                    writer.write(b"error unknown\n")
+
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            if table:
+                table.leave(colour)
+
+                for player in table.players.values():
+                    player.write(f"left {colour}\n".encode())
+
+                if not table.players and self.tables.get(table.name) is table:
+                    del self.tables[table.name]
+
+            writer.close()
+
+    def moved(self, table):
+        self.moves += 1
+
+        for c, writer in table.players.items():
+            writer.write(f"{table.view(c)}\n".encode())
+
+        if table.game.winner:
+            self.games += 1
+
+            if self.archive:
+                self.archive.append(table.game.start_file, table.game.history, table.game.winner)
+
+            del self.tables[table.name]
+
+
+class Bot:
+    """
+    A player for the load generator: it rebuilds the board from its view, and plays a random move that is valid on it.
+    The moves it cannot see are not valid on the server, and it then tries another one.
+    """
+
+    def __init__(self, start_file, engine="bitboard", seed=0):
+        self.start_file = start_file
+        self.engine = engine
+        self.rng = random.Random(seed)
+
+        self.colour = None
+        self.position = bytearray(TURN + 1)
+        self.turn = None
+        self.winner = None
+
+    def update(self, words):
+        ply, turn, winner, *changes = words
+        self.turn = turn
+        self.winner = None if winner == "-" else winner
+
+        for change in changes:
+            index, piece, memory = change.split(":")
+            index = int(index)
+
+            self.position[index] = 0 if piece == "x" else int(piece)
+            self.position[MEMORY[self.colour] + index] = int(memory)
+
+    def choose(self, tried):
+        game = Game(self.start_file, self.engine)
+        self.position[TURN] = self.colour == Piece.WHITE
+        game.unpack(self.position)
+
+        moves = [format_move(*m) for m in game.legal_moves(self.colour)]
+        moves = [m for m in moves if m not in tried]
+
+        return self.rng.choice(moves) if moves else None
+
+    async def play(self, host, port, table, max_plies=200):
+        """
+        :return: the winner, or None if the game was cut off
+        """
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(f"join {table}\n".encode())
+
+        tried = set()
+        ply = 0
+
+        try:
+            while True:
+                line = await reader.readline()
+
+                if not line:
+                    return None
+
+                command, *words = line.decode().split()
+
+                if command == "start":
+                    self.colour = words[0]
+                    continue
+                elif command == "left":
+                    return None
+                elif command == "view":
+                    self.update(words)
+                    ply = int(words[0])
+                    tried = set()
+                elif command != "error":
+                    continue
+
+                if self.winner or ply >= max_plies:
+                    return self.winner
+
+                if self.turn == self.colour:
+                    move = self.choose(tried)
+
+                    if not move:
+                        return None
+
+                    tried.add(move)
+                    writer.write(f"move {move}\n".encode())
+                    await writer.drain()
+        finally:
+            writer.close()
+
+
+async def load(host, port, games, start_file, engine="bitboard", max_plies=200, seed=0):
+    """
+    Play games at once between pairs of bots.
+
+    :return: the winners
+    """
+    bots = []
+
+    for i in range(games):
+        for colour in range(2):
+            bot = Bot(start_file, engine, seed + 2 * i + colour)
+            bots.append(bot.play(host, port, f"load{seed}-{i}", max_plies))
+
+    winners = await asyncio.gather(*bots)
+
+    return winners[::2]
+
+
+async def bench(games=100, start_file="starting_board.txt", engine="bitboard", max_plies=200):
+    """
+    Serve games to a load generator in the same process, on localhost.
+
+    :return: the number of finished games per second and of moves per second on the server
+    """
+    server = Server(start_file, engine)
+    listener = await server.serve("127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+
+    start = time.perf_counter()
+    await load("127.0.0.1", port, games, start_file, engine, max_plies)
+    seconds = time.perf_counter() - start
+
+    listener.close()
+    await listener.wait_closed()
+
+    return server.games / seconds, server.moves / seconds
+
+
+async def _serve(args):
+    server = Server(args.board, args.engine, args.archive)
+    listener = await server.serve(args.host, args.port)
+    print(f"serving {args.board} on port {args.port}", file=sys.stderr)
+
+    async with listener:
+        await listener.serve_forever()
+
+
+async def _load(args):
+    start = time.perf_counter()
+    winners = await load(args.host, args.port, args.games, args.board, args.engine, args.max_plies)
+    seconds = time.perf_counter() - start
+
+    print(f"{args.games} games in {seconds:.2f}s, {sum(map(bool, winners))} finished", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host fog of war games for many players, or load a server with bots.")
+    parser.add_argument("mode", choices=["serve", "load", "bench"], help="bench serves to its own bots")
+    parser.add_argument("board", nargs="?", default="starting_board.txt", help="the starting board file")
+    parser.add_argument("--host", default="")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("-n", "--games", type=int, default=100, help="the number of games at once of the bots")
+    parser.add_argument("--engine", default="bitboard", choices=["walk", "bitboard"])
+    parser.add_argument("--max-plies", type=int, default=200)
+    parser.add_argument("--archive", default=None, help="a game archive to append the finished games to, when serving")
+    parser.add_argument("--profile", default=None, help="count and time the hot functions, and write them to this JSON file")
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        instrument.enable(args.profile)
+
+    if args.mode == "serve":
+        asyncio.run(_serve(args))
+    elif args.mode == "load":
+        args.host = args.host or "127.0.0.1"
+        asyncio.run(_load(args))
+    else:
+        games, moves = asyncio.run(bench(args.games, args.board, args.engine, args.max_plies))
+        print(f"{games:.1f} games/s, {moves:.0f} moves/s", file=sys.stderr)
+
+
+__all__ = ["PORT", "Table", "Server", "Bot"]
+
+
+if __name__ == "__main__":
+    main()
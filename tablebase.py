@@ -0,0 +1,349 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from pieces import *
+from game import *
+from pieces import geometry, DIAGONALS, STRAIGHTS
+from game import TURN
+
+
+TABLES = "tablebases"
+
+# the order of the pieces of a colour in a table, pawns are not supported
+ORDER = [King, Queen, Rook, Bishop, Knight]
+SHAPES = {p.SHAPE: p for p in ORDER}
+
+# the score of a position whose side to move has lost, in a table being built
+LOST = -1000
+
+
+def material(name):
+    """
+    Read a set of pieces, e.g. "KDvK": the shapes of the white pieces, "v", the shapes of the black pieces.
+
+    :return: the (shape, colour) of every piece, in the order of the axes of its table
+    """
+    pieces = []
+
+    for colour, shapes in zip([Piece.WHITE, Piece.BLACK], name.split("v")):
+        for shape in shapes:
+            if shape not in SHAPES:
+                raise ValueError(f"Incorrect piece shape: {shape}")
+
+        pieces += [(s, colour) for s in sorted(shapes, key=lambda s: ORDER.index(SHAPES[s]))]
+
+    return pieces
+
+
+def material_name(pieces):
+    shapes = {c: "".join(s for s, colour in pieces if colour == c) for c in COLOURS}
+
+    return f"{shapes[Piece.WHITE]}v{shapes[Piece.BLACK]}"
+
+
+def alive(pieces):
+    """
+    :return: whether the game goes on with pieces, that is whether either colour has a king
+    """
+    return all((King.SHAPE, c) in pieces for c in COLOURS)
+
+
+def rays(shape, sq):
+    """
+    :return: the squares a piece of shape reaches from sq, as rays that stop at the first piece
+    """
+    g = geometry()
+
+    if shape == King.SHAPE:
+        return [(t,) for t in g.king[sq]]
+    elif shape == Knight.SHAPE:
+        return [(t,) for t in g.knight[sq]]
+
+    directions = {Queen.SHAPE: range(8), Rook.SHAPE: STRAIGHTS, Bishop.SHAPE: DIAGONALS}[shape]
+
+    return [g.rays[sq][d] for d in directions]
+
+
+def at(n, i, sq):
+    return tuple(sq if k == i else slice(None) for k in range(n))
+
+
+def sweep(pieces, scores, sub, turn):
+    """
+    Rate every position with turn to move by its best move, given the scores of the positions after it.
+
+    :param scores: the scores of all positions of pieces, per side to move
+    :param sub: the scores of the positions of pieces without one of them, by material name
+    :param turn: 1 for white to move, 0 for black
+    """
+    n = len(pieces)
+    colour = Piece.WHITE if turn else Piece.BLACK
+    after = scores[1 - turn]
+    best = np.full((64,) * n, 2 * LOST, np.int16)
+
+    for i, (shape, c) in enumerate(pieces):
+        if c != colour:
+            continue
+
+        # the squares of the other pieces, along the axes that are left once piece i is on a square
+        others = [k for k in range(n) if k != i]
+        grids = [np.arange(64).reshape([64 if b == a else 1 for b in range(n - 1)]) for a in range(n - 1)]
+
+        # the scores after taking piece k: the side to move has lost, has won, or a smaller table
+        taken = {}
+
+        for a, k in enumerate(others):
+            rest = pieces[:k] + pieces[k + 1:]
+
+            if alive(rest):
+                taken[k] = a, sub[material_name(rest)][1 - turn], i - (k < i)
+            else:
+                taken[k] = a, -LOST if (King.SHAPE, colour) not in rest else LOST, None
+
+        for f in range(64):
+            view = best[at(n, i, f)]
+
+            for ray in rays(shape, f):
+                blocked = False
+
+                for t in ray:
+                    child = after[at(n, i, t)]
+                    on = False
+
+                    for k, (a, table, j) in taken.items():
+                        here = grids[a] == t
+
+                        if j is not None:
+                            table = np.expand_dims(table[at(n - 1, j, t)], a)
+
+                        child = np.where(here, table, child)
+                        on = on | here
+
+                    score = -child
+                    score -= np.sign(score, dtype=np.int16)
+
+                    np.maximum(view, np.where(blocked, 2 * LOST, score), out=view)
+                    blocked = blocked | on
+
+    return best
+
+
+def solve(pieces, sub):
+    """
+    Find the score of every position of pieces by retrograde analysis: rate all positions by their best move
+    until nothing changes. A position the side to move wins in n plies scores -LOST - n, one it loses in n plies
+    scores LOST + n, and one that neither side can force scores 0.
+
+    :return: the scores, per side to move, and the number of sweeps
+    """
+    n = len(pieces)
+    grids = [np.arange(64).reshape([64 if b == a else 1 for b in range(n)]) for a in range(n)]
+    valid = np.ones((64,) * n, bool)
+
+    for a in range(n):
+        for b in range(a):
+            valid &= grids[a] != grids[b]
+
+    scores = np.zeros((2,) + (64,) * n, np.int16)
+    sweeps = 0
+
+    while True:
+        new = np.stack([sweep(pieces, scores, sub, turn) for turn in [0, 1]])
+        new[:, ~valid] = 0
+        sweeps += 1
+
+        if np.array_equal(new, scores):
+            return scores, sweeps
+
+        scores = new
+
+
+def to_plies(scores):
+    plies = np.where(scores > 0, -LOST - scores, np.where(scores < 0, LOST - scores, 0))
+
+    return plies.astype(np.int8 if np.abs(plies).max() <= 127 else np.int16)
+
+
+def from_plies(plies):
+    plies = plies.astype(np.int16)
+
+    return np.where(plies > 0, -LOST - plies, np.where(plies < 0, LOST - plies, 0)).astype(np.int16)
+
+
+def generate(name, directory=TABLES, tables=None):
+    """
+    Build the table of the set of pieces name, and those of all smaller sets it can turn into, unless they are in
+    directory already. A table holds, for the side to move and the square index of every piece, the plies to the end
+    of the game with perfect play: positive if the side to move wins, negative if it loses, and 0 if neither can
+    force a win or the position is not possible.
+
+    :return: the scores of the positions of name, see solve
+    """
+    tables = {} if tables is None else tables
+    path = os.path.join(directory, f"{name}.npy")
+
+    if name in tables:
+        return tables[name]
+
+    if os.path.exists(path):
+        tables[name] = from_plies(np.load(path))
+        return tables[name]
+
+    pieces = material(name)
+
+    if not alive(pieces):
+        raise ValueError(f"Both colours need a king: {name}")
+
+    for k in range(len(pieces)):
+        rest = pieces[:k] + pieces[k + 1:]
+
+        if alive(rest):
+            generate(material_name(rest), directory, tables)
+
+    start = time.perf_counter()
+    tables[name], sweeps = solve(pieces, tables)
+
+    os.makedirs(directory, exist_ok=True)
+    np.save(path, to_plies(tables[name]))
+
+    print(f"{name}: {sweeps} sweeps in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    return tables[name]
+
+
+def score(plies):
+    """
+    :return: how good a result in plies is for the side to move, so that winning sooner and losing later is better
+    """
+    return -LOST - plies if plies > 0 else LOST - plies if plies < 0 else 0
+
+
+class Tablebase:
+    """
+    Looks up positions with few pieces in the tables in a directory, loaded when first needed.
+    The tables know the whole board: in a game with fog of war, they play as if nothing were hidden.
+    """
+
+    def __init__(self, directory=TABLES):
+        self.directory = directory
+        self.tables = {}
+
+        names = [f[:-4] for f in os.listdir(directory) if f.endswith(".npy")] if os.path.isdir(directory) else []
+        self.names = set(names)
+        self.size = max((len(material(n)) for n in names), default=0)
+
+    def table(self, name):
+        if name not in self.tables:
+            self.tables[name] = np.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode="r")
+
+        return self.tables[name]
+
+    def probe(self, game):
+        """
+        :return: the plies to the end of game with perfect play: positive if the side to move wins, negative if it
+            loses, 0 if neither can force a win, or None if the position is not in the tables
+        """
+        if game.winner or game.board.shape != (8, 8):
+            return None
+
+        if len(game.pieces[Piece.WHITE]) + len(game.pieces[Piece.BLACK]) > self.size:
+            return None
+
+        pieces = []
+
+        for c in [Piece.WHITE, Piece.BLACK]:
+            for p in game.pieces[c]:
+                if p.shape not in SHAPES:
+                    return None
+
+                pieces.append((c == Piece.BLACK, ORDER.index(SHAPES[p.shape]), game.where[p].index, p.shape, c))
+
+        pieces.sort()
+        name = material_name([(s, c) for *_, s, c in pieces])
+
+        if name not in self.names:
+            return None
+
+        return int(self.table(name)[(game.state[TURN],) + tuple(sq for _, _, sq, *_ in pieces)])
+
+    def analyse(self, game):
+        """
+        :return: the plies to the end of game after each valid move, for the side making it, see probe,
+            or None if the position is not in the tables
+        """
+        if self.probe(game) is None:
+            return None
+
+        colour = game.turn
+        results = {}
+
+        for move in list(game.legal_moves(colour)):
+            game.make_move(*move)
+
+            if game.winner:
+                results[move] = 1 if game.winner == colour else -1
+            else:
+                plies = self.probe(game)
+                results[move] = -plies - (plies > 0) + (plies < 0)
+
+            game.unmake_move()
+
+        return results
+
+    def best_move(self, game):
+        """
+        :return: the plies to the end of game, and a move that keeps to it, or None if the position is not in the tables
+        """
+        results = self.analyse(game)
+
+        if not results:
+            return None
+
+        move = max(results, key=lambda m: score(results[m]))
+
+        return results[move], move
+
+
+__all__ = ["Tablebase", "generate", "material"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build endgame tables of few kings, queens, rooks, bishops and "
+                                                 "knights, or look up a position in them.")
+    parser.add_argument("mode", choices=["generate", "probe"])
+    parser.add_argument("names", nargs="*", help="generate: the sets of pieces, e.g. KDvK, all sets of up to three "
+                                                 "kings and queens by default; probe: a board file and the moves from it")
+    parser.add_argument("-d", "--directory", default=TABLES)
+    args = parser.parse_args(argv)
+
+    if args.mode == "generate":
+        tables = {}
+
+        for name in args.names or ["KvK", "KKvK", "KvKK", "KDvK", "KvKD"]:
+            generate(name, args.directory, tables)
+    else:
+        game = Game(args.names[0], "bitboard")
+        game.load()
+
+        for move in args.names[1:]:
+            game.read_move(move)
+
+        tablebase = Tablebase(args.directory)
+        results = tablebase.analyse(game)
+
+        if results is None:
+            print("not in the tables")
+            return
+
+        print(f"{game.turn} to move: {tablebase.probe(game)}")
+
+        for move, plies in sorted(results.items(), key=lambda item: -score(item[1])):
+            print(format_move(*move), plies)
+
+
+if __name__ == "__main__":
+    main()